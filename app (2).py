@@ -2,14 +2,18 @@ import streamlit as st
 import os
 import json
 import time
+import uuid
 from typing import List, Dict
 
 # Import core modules
 from pdf_processor import PDFProcessor
-from web_search import WebSearcher
-from vector_store import VectorStore
+from web_search import AsyncWebSearcher
+from vector_store import get_vector_store
+from embedding_models import warm_up_embedding_model
 from groq_handler import GroqHandler
-from config import AVAILABLE_MODELS, GROQ_API_KEY
+from retrieval import retrieve_sources
+from ingest_jobs import get_ingest_jobs
+from config import AVAILABLE_MODELS, GROQ_API_KEY, VECTOR_STORE_DIR, INGEST_JOB_POLL_SECONDS
 
 # Import export utilities
 try:
@@ -601,23 +605,41 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Load the shared embedding model once per process, before any session needs it
+warm_up_embedding_model()
+
+def get_user_id() -> str:
+    """Stable id for this browser, kept in the page URL so its ingest jobs can be found again after a restart"""
+    query_params = getattr(st, "query_params", None)
+    if query_params is None:
+        return uuid.uuid4().hex
+    user_id = query_params.get("user")
+    if not user_id:
+        user_id = uuid.uuid4().hex
+        query_params["user"] = user_id
+    return user_id
+
 # Initialize session state
 def initialize_session_state():
     """Initialize all session state variables"""
-    if 'vector_store' not in st.session_state:
-        st.session_state.vector_store = VectorStore()
+    # One knowledge base per process, loaded once; re-read every run in case another session cleared it
+    st.session_state.vector_store = get_vector_store()
     if 'pdf_processor' not in st.session_state:
         st.session_state.pdf_processor = PDFProcessor()
     if 'web_searcher' not in st.session_state:
-        st.session_state.web_searcher = WebSearcher()
+        st.session_state.web_searcher = AsyncWebSearcher()
     if 'groq_handler' not in st.session_state:
         st.session_state.groq_handler = GroqHandler()
     if 'pdf_processed' not in st.session_state:
-        st.session_state.pdf_processed = False
+        st.session_state.pdf_processed = st.session_state.vector_store.live_count > 0
     if 'chat_history' not in st.session_state:
         st.session_state.chat_history = []
     if 'pdf_files_info' not in st.session_state:
         st.session_state.pdf_files_info = []
+    if 'user_id' not in st.session_state:
+        st.session_state.user_id = get_user_id()
+    if 'merged_jobs' not in st.session_state:
+        st.session_state.merged_jobs = set()
     
     # Voice integration (conditional)
     if VOICE_AVAILABLE and 'voice_integration' not in st.session_state:
@@ -646,93 +668,125 @@ def display_animated_message(message, message_type="info"):
     else:
         st.markdown(f'<div class="info-card">ℹ️ {message}</div>', unsafe_allow_html=True)
 
-def process_pdfs(uploaded_files):
-    """Process uploaded PDF files with enhanced UI feedback"""
-    st.markdown('<div class="search-animation">', unsafe_allow_html=True)
-    with st.spinner("🔄 Processing PDFs..."):
-        all_chunks = []
-        processed_files = []
-        
-        progress_bar = st.progress(0)
-        status_placeholder = st.empty()
+def process_pdfs(uploaded_files, replace_file_id=None):
+    """Queue uploaded PDF files for processing in the background, optionally replacing a stored document"""
+    try:
+        get_ingest_jobs().submit(
+            st.session_state.user_id,
+            uploaded_files,
+            st.session_state.pdf_processor,
+            st.session_state.vector_store,
+            replace_file_id=replace_file_id
+        )
+        display_animated_message(f"Queued {len(uploaded_files)} PDFs for processing", "info")
+    except Exception as e:
+        display_animated_message(f"Error queueing PDFs: {str(e)}", "error")
+
+def show_ingest_jobs():
+    """Show this user's ingest jobs, including ones interrupted by a restart, and pick up the results of finished ones"""
+    active = False
+    merged = False
+    
+    for job in get_ingest_jobs().list_jobs(st.session_state.user_id):
+        job_id = job["id"]
+        names = ", ".join(job["files"])
         
-        for i, uploaded_file in enumerate(uploaded_files):
-            # Update progress with animation
-            progress_bar.progress((i + 1) / len(uploaded_files))
-            status_placeholder.markdown(f'<div class="typewriter">📄 Processing: {uploaded_file.name}</div>', unsafe_allow_html=True)
-            
-            try:
-                # Extract text
-                text = st.session_state.pdf_processor.extract_text_from_pdf(uploaded_file)
-                
-                if text:
-                    # Chunk text
-                    chunks = st.session_state.pdf_processor.chunk_text(text)
-                    all_chunks.extend(chunks)
-                    
-                    # Store file info
-                    file_info = {
-                        'name': uploaded_file.name,
-                        'size': len(text),
-                        'chunks': len(chunks),
-                        'preview': st.session_state.pdf_processor.get_text_preview(text)
-                    }
-                    processed_files.append(file_info)
-                    
-                    display_animated_message(f"Processed: {uploaded_file.name} ({len(chunks)} chunks)", "success")
-                else:
-                    display_animated_message(f"Failed to process: {uploaded_file.name}", "error")
-            
-            except Exception as e:
-                display_animated_message(f"Error processing {uploaded_file.name}: {str(e)}", "error")
+        if job["status"] == "queued":
+            active = True
+            st.markdown(f'<div class="status-warning">⏳ Queued: {names}</div>', unsafe_allow_html=True)
+        elif job["status"] == "running":
+            active = True
+            eta = f", about {job['eta_seconds']:.0f}s left" if job["eta_seconds"] is not None else ""
+            st.progress(job["progress"])
+            st.markdown(f'<div class="typewriter">📄 Processing: {names} ({job["chunks"]} chunks indexed{eta})</div>', unsafe_allow_html=True)
+            if job["chunks"]:
+                st.session_state.pdf_processed = True
+        elif job["status"] == "done":
+            st.markdown(f'<div class="status-success">✅ Processed: {names} ({job["chunks"]} chunks)</div>', unsafe_allow_html=True)
+        elif job["status"] == "cancelled":
+            st.markdown(f'<div class="status-warning">🚫 Cancelled: {names} (knowledge base cleared)</div>', unsafe_allow_html=True)
+        else:
+            display_animated_message(f"Failed to process: {names} ({job['status']})", "error")
         
-        progress_bar.empty()
-        status_placeholder.empty()
+        for error in job["errors"]:
+            display_animated_message(error, "warning")
         
-        # Add to vector store
-        if all_chunks:
-            try:
-                st.session_state.vector_store.add_texts(all_chunks)
+        if job["status"] not in ("queued", "running") and job_id not in st.session_state.merged_jobs:
+            st.session_state.merged_jobs.add(job_id)
+            # A replaced document keeps its file id, and documents removed from the shared store drop out
+            new_ids = {file_info["file_id"] for file_info in job["results"]}
+            files = st.session_state.vector_store.files
+            file_infos = [
+                file_info for file_info in st.session_state.pdf_files_info
+                if file_info.get("file_id") is None or file_info["file_id"] not in new_ids
+            ] + job["results"]
+            st.session_state.pdf_files_info = [
+                file_info for file_info in file_infos if file_info.get("file_id") is None or file_info["file_id"] in files
+            ]
+            if job["chunks"]:
                 st.session_state.pdf_processed = True
-                st.session_state.pdf_files_info = processed_files
-                display_animated_message(f"🎉 Successfully processed {len(uploaded_files)} PDFs with {len(all_chunks)} text chunks!", "success")
-            except Exception as e:
-                display_animated_message(f"Error adding to vector store: {str(e)}", "error")
+            merged = True
     
-    st.markdown('</div>', unsafe_allow_html=True)
+    if merged:
+        # Refresh the status section with the new files
+        st.rerun()
+    if active and not hasattr(st, "fragment"):
+        st.button("🔄 Refresh progress")
+
+def own_files() -> Dict[int, str]:
+    """Names of the files this user ingested that are still in the shared knowledge base, by file id"""
+    files = st.session_state.vector_store.files
+    return {
+        file_info["file_id"]: file_info["name"] for file_info in st.session_state.pdf_files_info
+        if file_info.get("file_id") in files
+    }
+
+# Polls job progress without rerunning the whole page; only used while jobs are pending,
+# and the rerun after the last one finishes switches back to the static view
+if hasattr(st, "fragment"):
+    poll_ingest_jobs = st.fragment(run_every=INGEST_JOB_POLL_SECONDS)(show_ingest_jobs)
+else:
+    poll_ingest_jobs = show_ingest_jobs
 
 def search_sources(question: str, search_options: List[str]):
-    """Search both PDF and web sources with animated feedback"""
+    """Search both PDF and web sources concurrently with animated feedback"""
     pdf_results = []
     web_results = []
     
     try:
-        # Search PDF content
-        if st.session_state.pdf_processed and "PDF Content" in search_options:
-            with st.spinner("🔍 Searching PDF content..."):
-                pdf_search_results = st.session_state.vector_store.search(question, k=3)
-                pdf_results = [text for text, score in pdf_search_results if score > 0.3]
-        
-        # Search web
-        if "Web Sources" in search_options:
-            with st.spinner("🌐 Searching web sources..."):
-                web_results = st.session_state.web_searcher.search_multiple_sources(question, max_results=3)
+        with st.spinner("🔍 Searching PDF content and web sources..."):
+            retrieval = retrieve_sources(
+                question,
+                st.session_state.vector_store,
+                st.session_state.web_searcher,
+                search_pdf=st.session_state.pdf_processed and "PDF Content" in search_options,
+                search_web="Web Sources" in search_options,
+                pdf_k=3,
+                web_max=3,
+                threshold=0.3
+            )
+        st.session_state.last_retrieval = retrieval
+        pdf_results, web_results = retrieval["pdf"], retrieval["web"]
     
     except Exception as e:
         display_animated_message(f"Search error: {str(e)}", "error")
     
     return pdf_results, web_results
 
-def display_sources(pdf_results: List[str], web_results: List[Dict]):
+def display_sources(pdf_results: List[str], web_results: List[Dict], pdf_sources: List[Dict] = None):
     """Display the sources used for the answer with enhanced styling"""
     if pdf_results or web_results:
         with st.expander("📚 Sources Used", expanded=False):
             if pdf_results:
                 st.markdown("### 📄 **PDF Sources:**")
                 for i, text in enumerate(pdf_results, 1):
+                    source = pdf_sources[i - 1] if pdf_sources and i <= len(pdf_sources) else {}
+                    citation = source.get("file_name") or f"PDF Source {i}"
+                    if source.get("page") is not None:
+                        citation += f", p. {source['page']}"
                     st.markdown(f'''
                     <div class="source-box">
-                        <strong>📄 PDF Source {i}:</strong><br>
+                        <strong>📄 {citation}:</strong><br>
                         <em>{text[:200]}...</em>
                     </div>
                     ''', unsafe_allow_html=True)
@@ -864,8 +918,18 @@ with st.sidebar:
     )
     
     if uploaded_files:
+        replace_file_id = None
+        replaceable = own_files()
+        if len(uploaded_files) == 1 and replaceable:
+            replace_file_id = st.selectbox(
+                "Replace existing document",
+                [None] + list(replaceable),
+                format_func=lambda file_id: "None (add as new)" if file_id is None else f"{replaceable[file_id]} (#{file_id})",
+                help="Swap one of your documents for this upload without re-indexing the others"
+            )
+        
         if st.button("🔄 Process PDFs", type="primary", key="process_pdfs"):
-            process_pdfs(uploaded_files)
+            process_pdfs(uploaded_files, replace_file_id)
         
         # Show file details with animation
         if uploaded_files:
@@ -972,6 +1036,11 @@ with st.sidebar:
     # Status section
     st.markdown('<div class="info-card">', unsafe_allow_html=True)
     st.header("📊 Status")
+    user_jobs = get_ingest_jobs().list_jobs(st.session_state.user_id)
+    if any(job["status"] in ("queued", "running") for job in user_jobs):
+        poll_ingest_jobs()
+    elif user_jobs:
+        show_ingest_jobs()
     if st.session_state.pdf_processed:
         st.markdown('<div class="status-success">✅ PDFs processed</div>', unsafe_allow_html=True)
         try:
@@ -992,6 +1061,16 @@ with st.sidebar:
                         • Preview: {file_info['preview']}
                     </div>
                     ''', unsafe_allow_html=True)
+                    if file_info.get("file_id") is not None and st.button("🗑️ Remove", key=f"remove_{file_info['file_id']}"):
+                        try:
+                            vector_store = st.session_state.vector_store
+                            vector_store.remove_document(file_info["file_id"])
+                            get_ingest_jobs().save_store(vector_store, VECTOR_STORE_DIR)
+                            st.session_state.pdf_files_info.remove(file_info)
+                            st.session_state.pdf_processed = vector_store.live_count > 0
+                            st.rerun()
+                        except Exception as e:
+                            display_animated_message(f"Remove error: {str(e)}", "error")
     else:
         st.markdown('<div class="status-warning">⏳ No PDFs processed yet</div>', unsafe_allow_html=True)
     
@@ -1009,17 +1088,30 @@ with st.sidebar:
     st.markdown('</div>', unsafe_allow_html=True)
     st.markdown("---")
     
-    # Clear data option
-    if st.button("🗑️ Clear All Data", help="Clear processed PDFs and chat history"):
-        try:
-            st.session_state.vector_store = VectorStore()
-            st.session_state.pdf_processed = False
-            st.session_state.chat_history = []
-            st.session_state.pdf_files_info = []
-            display_animated_message("All data cleared!", "success")
+    # Clear data option; the knowledge base is shared, so only this user's documents go
+    if st.session_state.get("confirm_clear"):
+        display_animated_message("Remove your PDFs from the shared knowledge base and clear your chat history?", "warning")
+        confirm_col, cancel_col = st.columns(2)
+        if confirm_col.button("Yes, clear", type="primary", key="confirm_clear_data"):
+            try:
+                vector_store = st.session_state.vector_store
+                for file_id in own_files():
+                    vector_store.remove_document(file_id)
+                get_ingest_jobs().save_store(vector_store, VECTOR_STORE_DIR)
+                st.session_state.pdf_processed = vector_store.live_count > 0
+                st.session_state.chat_history = []
+                st.session_state.pdf_files_info = []
+                st.session_state.confirm_clear = False
+                display_animated_message("Your data was cleared!", "success")
+                st.rerun()
+            except Exception as e:
+                display_animated_message(f"Clear data error: {str(e)}", "error")
+        if cancel_col.button("Cancel", key="cancel_clear_data"):
+            st.session_state.confirm_clear = False
             st.rerun()
-        except Exception as e:
-            display_animated_message(f"Clear data error: {str(e)}", "error")
+    elif st.button("🗑️ Clear My Data", help="Remove the PDFs you uploaded from the shared knowledge base and clear your chat history"):
+        st.session_state.confirm_clear = True
+        st.rerun()
 
 # Main content area
 col1, col2 = st.columns([3, 1])
@@ -1170,7 +1262,7 @@ with col1:
                     st.markdown('</div>', unsafe_allow_html=True)
                     
                     # Display sources
-                    display_sources(pdf_results, web_results)
+                    display_sources(pdf_results, web_results, st.session_state.get("last_retrieval", {}).get("pdf_sources"))
                     
                 else:
                     display_animated_message("No relevant sources found. Try different search terms or upload relevant PDFs.", "warning")
@@ -1361,8 +1453,8 @@ if st.button("🔧 Troubleshoot Issues", help="Reset components if something isn
         with st.spinner("🔧 Troubleshooting..."):
             # Re-initialize components
             st.session_state.groq_handler = GroqHandler()
-            st.session_state.vector_store = VectorStore()
-            st.session_state.web_searcher = WebSearcher()
+            st.session_state.vector_store = get_vector_store()
+            st.session_state.web_searcher = AsyncWebSearcher()
             st.session_state.pdf_processor = PDFProcessor()
             
             # Test connections
@@ -1623,39 +1715,40 @@ with col1:
                 search_progress = st.progress(0)
                 search_status = st.empty()
                 
-                # Search PDF content
-                pdf_results = []
-                if st.session_state.pdf_processed and "PDF Content" in search_options:
-                    search_status.markdown('<div class="status-success">📄 Searching PDF documents...</div>', unsafe_allow_html=True)
-                    search_progress.progress(25)
-                    
-                    pdf_search_results = st.session_state.vector_store.search(question, k=5 if search_depth == "Deep" else 3)
-                    threshold = 0.2 if search_depth == "Deep" else 0.3
-                    pdf_results = [text for text, score in pdf_search_results if score > threshold]
-                    
+                # Search PDF and web content concurrently
+                search_pdf = st.session_state.pdf_processed and "PDF Content" in search_options
+                search_web = "Web Sources" in search_options
+                search_status.markdown('<div class="status-success">📄 Searching PDF documents and web sources...</div>', unsafe_allow_html=True)
+                search_progress.progress(25)
+                
+                retrieval = retrieve_sources(
+                    question,
+                    st.session_state.vector_store,
+                    st.session_state.web_searcher,
+                    search_pdf=search_pdf,
+                    search_web=search_web,
+                    pdf_k=5 if search_depth == "Deep" else 3,
+                    web_max=5 if search_depth == "Deep" else 3,
+                    threshold=0.2 if search_depth == "Deep" else 0.3
+                )
+                st.session_state.last_retrieval = retrieval
+                pdf_results, web_results = retrieval["pdf"], retrieval["web"]
+                
+                if search_pdf:
                     if pdf_results:
                         search_status.markdown(f'<div class="status-success">📄 Found {len(pdf_results)} relevant PDF sections</div>', unsafe_allow_html=True)
                     else:
                         search_status.markdown('<div class="status-warning">📄 No relevant PDF content found</div>', unsafe_allow_html=True)
                 
-                search_progress.progress(50)
+                search_progress.progress(75)
                 
-                # Search web content
-                web_results = []
-                if "Web Sources" in search_options:
-                    search_status.markdown('<div class="status-success">🌐 Searching web sources...</div>', unsafe_allow_html=True)
-                    search_progress.progress(75)
-                    
-                    max_results = 5 if search_depth == "Deep" else 3
-                    web_results = st.session_state.web_searcher.search_multiple_sources(question, max_results=max_results)
-                    
+                if search_web:
                     if web_results:
                         search_status.markdown(f'<div class="status-success">🌐 Found {len(web_results)} web sources</div>', unsafe_allow_html=True)
                     else:
                         search_status.markdown('<div class="status-warning">🌐 No relevant web content found</div>', unsafe_allow_html=True)
                 
                 search_progress.progress(100)
-                time.sleep(0.5)  # Brief pause for effect
                 search_progress.empty()
                 search_status.empty()
             
@@ -1946,39 +2039,40 @@ with col1:
                 search_progress = st.progress(0)
                 search_status = st.empty()
                 
-                # Search PDF content
-                pdf_results = []
-                if st.session_state.pdf_processed and "PDF Content" in search_options:
-                    search_status.markdown('<div class="status-success"> Searching PDF documents...</div>', unsafe_allow_html=True)
-                    search_progress.progress(25)
-                    
-                    pdf_search_results = st.session_state.vector_store.search(question, k=5 if search_depth == "Deep" else 3)
-                    threshold = 0.2 if search_depth == "Deep" else 0.3
-                    pdf_results = [text for text, score in pdf_search_results if score > threshold]
-                    
+                # Search PDF and web content concurrently
+                search_pdf = st.session_state.pdf_processed and "PDF Content" in search_options
+                search_web = "Web Sources" in search_options
+                search_status.markdown('<div class="status-success"> Searching PDF documents and web sources...</div>', unsafe_allow_html=True)
+                search_progress.progress(25)
+                
+                retrieval = retrieve_sources(
+                    question,
+                    st.session_state.vector_store,
+                    st.session_state.web_searcher,
+                    search_pdf=search_pdf,
+                    search_web=search_web,
+                    pdf_k=5 if search_depth == "Deep" else 3,
+                    web_max=5 if search_depth == "Deep" else 3,
+                    threshold=0.2 if search_depth == "Deep" else 0.3
+                )
+                st.session_state.last_retrieval = retrieval
+                pdf_results, web_results = retrieval["pdf"], retrieval["web"]
+                
+                if search_pdf:
                     if pdf_results:
                         search_status.markdown(f'<div class="status-success"> Found {len(pdf_results)} relevant PDF sections</div>', unsafe_allow_html=True)
                     else:
                         search_status.markdown('<div class="status-warning"> No relevant PDF content found</div>', unsafe_allow_html=True)
                 
-                search_progress.progress(50)
+                search_progress.progress(75)
                 
-                # Search web content
-                web_results = []
-                if "Web Sources" in search_options:
-                    search_status.markdown('<div class="status-success"> Searching web sources...</div>', unsafe_allow_html=True)
-                    search_progress.progress(75)
-                    
-                    max_results = 5 if search_depth == "Deep" else 3
-                    web_results = st.session_state.web_searcher.search_multiple_sources(question, max_results=max_results)
-                    
+                if search_web:
                     if web_results:
                         search_status.markdown(f'<div class="status-success">Found {len(web_results)} web sources</div>', unsafe_allow_html=True)
                     else:
                         search_status.markdown('<div class="status-warning">No relevant web content found</div>', unsafe_allow_html=True)
                 
                 search_progress.progress(100)
-                time.sleep(0.5)  # Brief pause for effect
                 search_progress.empty()
                 search_status.empty()
             
@@ -2101,7 +2195,7 @@ with col1:
                 st.markdown('</div>', unsafe_allow_html=True)
                 
                 # Display sources
-                display_sources(pdf_results, web_results)
+                display_sources(pdf_results, web_results, st.session_state.get("last_retrieval", {}).get("pdf_sources"))
                 
             else:
                 display_animated_message("No relevant sources found. Try different search terms or upload relevant PDFs.", "warning")
@@ -2483,78 +2577,41 @@ st.markdown('''
             
             params = search_params.get(search_mode, search_params["⚡ Standard"])
             
-            # Search PDF Content
-            pdf_results = []
-            if st.session_state.pdf_processed and "PDF Content" in search_options:
-                search_status.markdown('''
-                <div style="background: rgba(102, 126, 234, 0.2); padding: 0.8rem; 
-                     border-radius: 8px; border-left: 3px solid #667eea; animation: pulse 1s infinite;">
-                    📄 <strong>Searching PDF documents...</strong>
-                </div>
-                ''', unsafe_allow_html=True)
-                search_progress.progress(25)
-                
-                pdf_search_results = st.session_state.vector_store.search(question, k=params["pdf_k"])
-                pdf_results = [text for text, score in pdf_search_results if score > params["threshold"]]
-                
-                # Update status
-                if pdf_results:
-                    search_status.markdown(f'''
-                    <div style="background: rgba(0, 242, 96, 0.2); padding: 0.8rem; 
-                         border-radius: 8px; border-left: 3px solid #00f260;">
-                        ✅ <strong>Found {len(pdf_results)} relevant PDF sections</strong>
-                    </div>
-                    ''', unsafe_allow_html=True)
-                else:
-                    search_status.markdown('''
-                    <div style="background: rgba(240, 147, 251, 0.2); padding: 0.8rem; 
-                         border-radius: 8px; border-left: 3px solid #f093fb;">
-                        ⚠️ <strong>No highly relevant PDF content found</strong>
-                    </div>
-                    ''', unsafe_allow_html=True)
-                
-                time.sleep(0.5)  # Visual pause
-                search_progress.progress(50)
+            # Search PDF content and web sources concurrently
+            search_pdf = st.session_state.pdf_processed and "PDF Content" in search_options
+            search_web = "Web Sources" in search_options
+            search_status.markdown('''
+            <div style="background: rgba(102, 126, 234, 0.2); padding: 0.8rem; 
+                 border-radius: 8px; border-left: 3px solid #667eea; animation: pulse 1s infinite;">
+                🔍 <strong>Searching PDF documents and web sources...</strong>
+            </div>
+            ''', unsafe_allow_html=True)
+            search_progress.progress(25)
             
-            # Search Web Sources
-            web_results = []
-            if "Web Sources" in search_options:
-                search_status.markdown('''
-                <div style="background: rgba(17, 153, 142, 0.2); padding: 0.8rem; 
-                     border-radius: 8px; border-left: 3px solid #11998e; animation: pulse 1s infinite;">
-                    🌐 <strong>Searching web sources...</strong>
-                </div>
-                ''', unsafe_allow_html=True)
-                search_progress.progress(75)
-                
-                web_results = st.session_state.web_searcher.search_multiple_sources(
-                    question, max_results=params["web_max"]
-                )
-                
-                # Update status
-                if web_results:
-                    search_status.markdown(f'''
-                    <div style="background: rgba(0, 242, 96, 0.2); padding: 0.8rem; 
-                         border-radius: 8px; border-left: 3px solid #00f260;">
-                        ✅ <strong>Found {len(web_results)} web sources</strong>
-                    </div>
-                    ''', unsafe_allow_html=True)
-                else:
-                    search_status.markdown('''
-                    <div style="background: rgba(240, 147, 251, 0.2); padding: 0.8rem; 
-                         border-radius: 8px; border-left: 3px solid #f093fb;">
-                        ⚠️ <strong>Limited web results found</strong>
-                    </div>
-                    ''', unsafe_allow_html=True)
-                
-                time.sleep(0.5)  # Visual pause
-                search_progress.progress(100)
+            retrieval = retrieve_sources(
+                question,
+                st.session_state.vector_store,
+                st.session_state.web_searcher,
+                search_pdf=search_pdf,
+                search_web=search_web,
+                pdf_k=params["pdf_k"],
+                web_max=params["web_max"],
+                threshold=params["threshold"],
+                search_mode=search_mode
+            )
+            st.session_state.last_retrieval = retrieval
+            pdf_results, web_results = retrieval["pdf"], retrieval["web"]
             
             # Complete search process
-            time.sleep(1)
+            search_progress.progress(100)
             search_progress.empty()
             search_status.empty()
             
+            if retrieval["timed_out"]:
+                display_animated_message(
+                    f"Skipped slow sources: {', '.join(retrieval['timed_out'])}", "warning"
+                )
+            
             # Results Summary with Enhanced Visualization
             total_sources = len(pdf_results) + len(web_results)
             
@@ -2625,8 +2682,6 @@ st.markdown('''
                             </div>
                             ''', unsafe_allow_html=True)
                             
-                            time.sleep(1)  # Brief pause for effect
-                            
                             # Stream the response
                             for chunk in stream:
                                 if chunk.choices[0].delta.content is not None:
@@ -2708,7 +2763,7 @@ st.markdown('''
                         display_animated_message(f"Voice output error: {str(e)}", "warning")
                 
                 # Enhanced Sources Display
-                display_sources(pdf_results, web_results)
+                display_sources(pdf_results, web_results, st.session_state.get("last_retrieval", {}).get("pdf_sources"))
                 
                 # Follow-up Questions (if enabled)
                 if include_followup and st.session_state.chat_history:
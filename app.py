@@ -2,13 +2,17 @@
 import streamlit as st
 import os
 from pdf_processor import PDFProcessor
-from web_search import WebSearcher
-from vector_store import VectorStore
+from web_search import AsyncWebSearcher
+from vector_store import get_vector_store
+from embedding_models import warm_up_embedding_model
 from groq_handler import GroqHandler
-from config import AVAILABLE_MODELS, GROQ_API_KEY
+from retrieval import retrieve_sources
+from ingest_jobs import get_ingest_jobs
+from config import AVAILABLE_MODELS, GROQ_API_KEY, VECTOR_STORE_DIR, INGEST_JOB_POLL_SECONDS
 from typing import List, Dict
 import time
 import json
+import uuid
 
 import streamlit as st
 from streamlit_lottie import st_lottie
@@ -52,91 +56,148 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Load the shared embedding model once per process, before any session needs it
+warm_up_embedding_model()
+
+def get_user_id() -> str:
+    """Stable id for this browser, kept in the page URL so its ingest jobs can be found again after a restart"""
+    query_params = getattr(st, "query_params", None)
+    if query_params is None:
+        return uuid.uuid4().hex
+    user_id = query_params.get("user")
+    if not user_id:
+        user_id = uuid.uuid4().hex
+        query_params["user"] = user_id
+    return user_id
+
 # Initialize session state
 def initialize_session_state():
-    if 'vector_store' not in st.session_state:
-        st.session_state.vector_store = VectorStore()
+    # One knowledge base per process, loaded once; re-read every run in case another session cleared it
+    st.session_state.vector_store = get_vector_store()
     if 'pdf_processor' not in st.session_state:
         st.session_state.pdf_processor = PDFProcessor()
     if 'web_searcher' not in st.session_state:
-        st.session_state.web_searcher = WebSearcher()
+        st.session_state.web_searcher = AsyncWebSearcher()
     if 'groq_handler' not in st.session_state:
         st.session_state.groq_handler = GroqHandler()
     if 'pdf_processed' not in st.session_state:
-        st.session_state.pdf_processed = False
+        st.session_state.pdf_processed = st.session_state.vector_store.live_count > 0
     if 'chat_history' not in st.session_state:
         st.session_state.chat_history = []
     if 'pdf_files_info' not in st.session_state:
         st.session_state.pdf_files_info = []
+    if 'user_id' not in st.session_state:
+        st.session_state.user_id = get_user_id()
+    if 'merged_jobs' not in st.session_state:
+        st.session_state.merged_jobs = set()
 
 initialize_session_state()
 
-def process_pdfs(uploaded_files):
-    """Process uploaded PDF files"""
-    with st.spinner("🔄 Processing PDFs..."):
-        all_chunks = []
-        processed_files = []
-        
-        progress_bar = st.progress(0)
+def process_pdfs(uploaded_files, replace_file_id=None):
+    """Queue uploaded PDF files for processing in the background, optionally replacing a stored document"""
+    get_ingest_jobs().submit(
+        st.session_state.user_id,
+        uploaded_files,
+        st.session_state.pdf_processor,
+        st.session_state.vector_store,
+        replace_file_id=replace_file_id
+    )
+    st.info(f"📥 Queued {len(uploaded_files)} PDFs for processing")
+
+def show_ingest_jobs():
+    """Show this user's ingest jobs, including ones interrupted by a restart, and pick up the results of finished ones"""
+    active = False
+    merged = False
+    
+    for job in get_ingest_jobs().list_jobs(st.session_state.user_id):
+        job_id = job["id"]
+        names = ", ".join(job["files"])
         
-        for i, uploaded_file in enumerate(uploaded_files):
-            # Update progress
-            progress_bar.progress((i + 1) / len(uploaded_files))
-            
-            # Extract text
-            text = st.session_state.pdf_processor.extract_text_from_pdf(uploaded_file)
-            
-            if text:
-                # Chunk text
-                chunks = st.session_state.pdf_processor.chunk_text(text)
-                all_chunks.extend(chunks)
-                
-                # Store file info
-                file_info = {
-                    'name': uploaded_file.name,
-                    'size': len(text),
-                    'chunks': len(chunks),
-                    'preview': st.session_state.pdf_processor.get_text_preview(text)
-                }
-                processed_files.append(file_info)
-                
-                st.success(f"✅ Processed: {uploaded_file.name} ({len(chunks)} chunks)")
-            else:
-                st.error(f"❌ Failed to process: {uploaded_file.name}")
+        if job["status"] == "queued":
+            active = True
+            st.caption(f"⏳ Queued: {names}")
+        elif job["status"] == "running":
+            active = True
+            eta = f", about {job['eta_seconds']:.0f}s left" if job["eta_seconds"] is not None else ""
+            st.progress(job["progress"])
+            st.caption(f"🔄 {names}: {job['chunks']} chunks indexed{eta}")
+            if job["chunks"]:
+                st.session_state.pdf_processed = True
+        elif job["status"] == "done":
+            st.success(f"✅ Processed: {names} ({job['chunks']} chunks)")
+        elif job["status"] == "cancelled":
+            st.caption(f"🚫 Cancelled: {names} (knowledge base cleared)")
+        else:
+            st.error(f"❌ Failed to process: {names} ({job['status']})")
         
-        progress_bar.empty()
+        for error in job["errors"]:
+            st.caption(f"⚠️ {error}")
         
-        # Add to vector store
-        if all_chunks:
-            st.session_state.vector_store.add_texts(all_chunks)
-            st.session_state.pdf_processed = True
-            st.session_state.pdf_files_info = processed_files
-            st.success(f"🎉 Successfully processed {len(uploaded_files)} PDFs with {len(all_chunks)} text chunks!")
+        if job["status"] not in ("queued", "running") and job_id not in st.session_state.merged_jobs:
+            st.session_state.merged_jobs.add(job_id)
+            # A replaced document keeps its file id, and documents removed from the shared store drop out
+            new_ids = {file_info["file_id"] for file_info in job["results"]}
+            files = st.session_state.vector_store.files
+            file_infos = [
+                file_info for file_info in st.session_state.pdf_files_info
+                if file_info.get("file_id") is None or file_info["file_id"] not in new_ids
+            ] + job["results"]
+            st.session_state.pdf_files_info = [
+                file_info for file_info in file_infos if file_info.get("file_id") is None or file_info["file_id"] in files
+            ]
+            if job["chunks"]:
+                st.session_state.pdf_processed = True
+            merged = True
+    
+    if merged:
+        # Refresh the status section with the new files
+        st.rerun()
+    if active and not hasattr(st, "fragment"):
+        st.button("🔄 Refresh progress")
+
+def own_files() -> Dict[int, str]:
+    """Names of the files this user ingested that are still in the shared knowledge base, by file id"""
+    files = st.session_state.vector_store.files
+    return {
+        file_info["file_id"]: file_info["name"] for file_info in st.session_state.pdf_files_info
+        if file_info.get("file_id") in files
+    }
+
+# Polls job progress without rerunning the whole page; only used while jobs are pending,
+# and the rerun after the last one finishes switches back to the static view
+if hasattr(st, "fragment"):
+    poll_ingest_jobs = st.fragment(run_every=INGEST_JOB_POLL_SECONDS)(show_ingest_jobs)
+else:
+    poll_ingest_jobs = show_ingest_jobs
 
 def search_sources(question: str, search_options: List[str]):
-    """Search both PDF and web sources"""
-    pdf_results = []
-    web_results = []
-    
-    # Search PDF content
-    if st.session_state.pdf_processed and "PDF Content" in search_options:
-        pdf_search_results = st.session_state.vector_store.search(question, k=3)
-        pdf_results = [text for text, score in pdf_search_results if score > 0.3]
-    
-    # Search web
-    if "Web Sources" in search_options:
-        web_results = st.session_state.web_searcher.search_multiple_sources(question, max_results=3)
+    """Search both PDF and web sources concurrently"""
+    retrieval = retrieve_sources(
+        question,
+        st.session_state.vector_store,
+        st.session_state.web_searcher,
+        search_pdf=st.session_state.pdf_processed and "PDF Content" in search_options,
+        search_web="Web Sources" in search_options,
+        pdf_k=3,
+        web_max=3,
+        threshold=0.3
+    )
+    st.session_state.last_retrieval = retrieval
     
-    return pdf_results, web_results
+    return retrieval["pdf"], retrieval["web"]
 
-def display_sources(pdf_results: List[str], web_results: List[Dict]):
+def display_sources(pdf_results: List[str], web_results: List[Dict], pdf_sources: List[Dict] = None):
     """Display the sources used for the answer"""
     if pdf_results or web_results:
         with st.expander("📚 Sources Used", expanded=False):
             if pdf_results:
                 st.markdown("**PDF Sources:**")
                 for i, text in enumerate(pdf_results, 1):
-                    st.markdown(f'<div class="source-box">📄 PDF Source {i}: {text[:200]}...</div>', unsafe_allow_html=True)
+                    source = pdf_sources[i - 1] if pdf_sources and i <= len(pdf_sources) else {}
+                    citation = source.get("file_name") or f"PDF Source {i}"
+                    if source.get("page") is not None:
+                        citation += f", p. {source['page']}"
+                    st.markdown(f'<div class="source-box">📄 {citation}: {text[:200]}...</div>', unsafe_allow_html=True)
             
             if web_results:
                 st.markdown("**Web Sources:**")
@@ -160,8 +221,18 @@ with st.sidebar:
     )
     
     if uploaded_files:
+        replace_file_id = None
+        replaceable = own_files()
+        if len(uploaded_files) == 1 and replaceable:
+            replace_file_id = st.selectbox(
+                "Replace existing document",
+                [None] + list(replaceable),
+                format_func=lambda file_id: "None (add as new)" if file_id is None else f"{replaceable[file_id]} (#{file_id})",
+                help="Swap one of your documents for this upload without re-indexing the others"
+            )
+        
         if st.button("🔄 Process PDFs", type="primary"):
-            process_pdfs(uploaded_files)
+            process_pdfs(uploaded_files, replace_file_id)
         
         # Show file details
         if uploaded_files:
@@ -205,6 +276,11 @@ with st.sidebar:
     
     # Status section
     st.header("📊 Status")
+    user_jobs = get_ingest_jobs().list_jobs(st.session_state.user_id)
+    if any(job["status"] in ("queued", "running") for job in user_jobs):
+        poll_ingest_jobs()
+    elif user_jobs:
+        show_ingest_jobs()
     if st.session_state.pdf_processed:
         st.success("✅ PDFs processed")
         vector_stats = st.session_state.vector_store.get_stats()
@@ -218,6 +294,13 @@ with st.sidebar:
                     st.write(f"- Chunks: {file_info['chunks']}")
                     st.write(f"- Size: {file_info['size']} characters")
                     st.write(f"- Preview: {file_info['preview']}")
+                    if file_info.get("file_id") is not None and st.button("🗑️ Remove", key=f"remove_{file_info['file_id']}"):
+                        vector_store = st.session_state.vector_store
+                        vector_store.remove_document(file_info["file_id"])
+                        get_ingest_jobs().save_store(vector_store, VECTOR_STORE_DIR)
+                        st.session_state.pdf_files_info.remove(file_info)
+                        st.session_state.pdf_processed = vector_store.live_count > 0
+                        st.rerun()
                     st.write("---")
     else:
         st.warning("⏳ No PDFs processed yet")
@@ -231,13 +314,26 @@ with st.sidebar:
     
     st.markdown("---")
     
-    # Clear data option
-    if st.button("🗑️ Clear All Data", help="Clear processed PDFs and chat history"):
-        st.session_state.vector_store = VectorStore()
-        st.session_state.pdf_processed = False
-        st.session_state.chat_history = []
-        st.session_state.pdf_files_info = []
-        st.success("✅ All data cleared!")
+    # Clear data option; the knowledge base is shared, so only this user's documents go
+    if st.session_state.get("confirm_clear"):
+        st.warning("Remove your PDFs from the shared knowledge base and clear your chat history?")
+        confirm_col, cancel_col = st.columns(2)
+        if confirm_col.button("Yes, clear", type="primary"):
+            vector_store = st.session_state.vector_store
+            for file_id in own_files():
+                vector_store.remove_document(file_id)
+            get_ingest_jobs().save_store(vector_store, VECTOR_STORE_DIR)
+            st.session_state.pdf_processed = vector_store.live_count > 0
+            st.session_state.chat_history = []
+            st.session_state.pdf_files_info = []
+            st.session_state.confirm_clear = False
+            st.success("✅ Your data was cleared!")
+            st.rerun()
+        if cancel_col.button("Cancel"):
+            st.session_state.confirm_clear = False
+            st.rerun()
+    elif st.button("🗑️ Clear My Data", help="Remove the PDFs you uploaded from the shared knowledge base and clear your chat history"):
+        st.session_state.confirm_clear = True
         st.rerun()
 
 # Main content area
@@ -340,7 +436,7 @@ with col1:
                         })
                 
                 # Display sources
-                display_sources(pdf_results, web_results)
+                display_sources(pdf_results, web_results, st.session_state.get("last_retrieval", {}).get("pdf_sources"))
                 
             else:
                 st.warning("⚠️ No relevant sources found. Try different search terms or upload relevant PDFs.")
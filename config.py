@@ -17,16 +17,133 @@ AVAILABLE_MODELS = {
     "Llama3 70B": "llama3-70b-8192"
 }
 
+# Model availability is probed concurrently in the background and cached
+MODEL_HEALTH_TTL = 300  # Seconds before a model's status is re-probed
+MODEL_PROBE_WORKERS = 8
+MODEL_PROBE_TIMEOUT = 10  # Seconds to wait for probes when a fresh answer is required
+
+# Resilient API calls: retries with jittered backoff, per-model circuit breakers, then fallback models
+MODEL_FALLBACK_CHAIN = ["llama3-8b-8192", "llama3-70b-8192"]
+API_MAX_RETRIES = 3
+RETRY_BASE_DELAY = 0.5  # Seconds, doubled per attempt
+RETRY_MAX_DELAY = 8.0  # Longer rate-limit waits fall back to the next model instead
+CIRCUIT_FAILURE_THRESHOLD = 5  # Consecutive failures before a model's circuit opens
+CIRCUIT_RESET_TIMEOUT = 30.0  # Seconds before a trial call is let through
+
+# Async Groq client: one pooled connection set per event loop
+GROQ_MAX_CONCURRENCY = 32  # Completions in flight per process
+GROQ_MAX_CONNECTIONS = 64
+GROQ_MAX_KEEPALIVE = 20
+GROQ_REQUEST_TIMEOUT = 60  # Seconds
+
 MAX_TOKENS = 1000
 TEMPERATURE = 0.7
 
+# Prompt context budget: retrieved sources are packed best-first into a share of the model's window
+MODEL_CONTEXT_WINDOWS = {
+    "mixtral-8x7b-32768": 32768,
+    "llama2-70b-4096": 4096,
+    "gemma-7b-it": 8192,
+    "llama3-8b-8192": 8192,
+    "llama3-70b-8192": 8192
+}
+DEFAULT_CONTEXT_WINDOW = 4096  # Unknown models get the smallest window
+CONTEXT_BUDGET_RATIO = 0.5  # Share of the window available to retrieved sources
+PROMPT_RESERVED_TOKENS = 300  # System prompt and instructions around the context
+CHARS_PER_TOKEN = {"llama3": 4.0, "gemma": 4.0, "mixtral": 3.5, "llama2": 3.5}  # By model prefix
+DEFAULT_CHARS_PER_TOKEN = 3.5
+CONTEXT_DEDUP_THRESHOLD = 0.8  # Word overlap at which a lower-ranked source counts as a duplicate
+PROMPT_CACHE_SIZE = 256  # Assembled prompts memoized per question and sources
+
+# Semantic answer cache: paraphrased questions over the same sources reuse answers
+SEMANTIC_CACHE_ENABLED = True
+SEMANTIC_CACHE_THRESHOLD = 0.92  # Cosine similarity between questions
+SEMANTIC_CACHE_MAX_ENTRIES = 1000
+
+# Response cache: identical (model, temperature, max_tokens, messages) requests reuse the stored completion
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", os.path.join(".cache", "responses.sqlite3"))
+RESPONSE_CACHE_TTL = 24 * 3600  # Seconds
+RESPONSE_CACHE_MAX_ENTRIES = 5000
+
 # Embedding settings
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
-CHUNK_SIZE = 500
-CHUNK_OVERLAP = 50
+FALLBACK_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_MAX_TOKENS = 256  # Input window used when the model does not report its max_seq_length
+
+# Chunking, in tokens of the embedding model's tokenizer; chunks never exceed its input window
+CHUNK_SIZE = 128
+CHUNK_OVERLAP = 16  # Whole trailing sentences of up to this many tokens are repeated in the next chunk
+
+# PDF processing settings
+PDF_EXTRACTION_WORKERS = os.cpu_count() or 1  # Processes used for page extraction
+PARALLEL_EXTRACTION_MIN_PAGES = 50  # Smaller PDFs are extracted in-process
+OCR_WORKERS = os.cpu_count() or 1  # Concurrent tesseract processes
+OCR_PAGE_BATCH = 4  # Pages rasterized per pdf2image call
+OCR_DPI = 200
+OCR_MIN_PAGE_CHARS = 20  # Pages with less text than this are OCR'd
+OCR_MIN_READABLE_RATIO = 0.6  # Share of letters/digits/spaces below which a text layer is garbage
+PDF_CACHE_ENABLED = True
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", os.path.join(".cache", "pdfs"))  # Keyed by SHA-256 of the upload
+PDF_CACHE_MAX_BYTES = 2 * 1024 ** 3  # Least recently used files are evicted beyond this
+PDF_CACHE_MAX_AGE_DAYS = 30  # Files not used for this long are evicted
+
+# Streaming ingestion: extract -> chunk -> embed -> index with bounded queues between stages
+INGEST_PAGE_RANGE = 16  # Pages extracted per step
+INGEST_BATCH_SIZE = 64  # Chunks embedded and indexed together
+INGEST_QUEUE_SIZE = 4  # Batches buffered between stages before producers block
+INGEST_FLUSH_SECONDS = 1.0  # A partial batch is indexed if no chunk arrives for this long
+
+# Background ingest jobs: fixed workers shared by all sessions, scheduled round-robin per user
+INGEST_JOB_WORKERS = 2
+INGEST_JOB_DIR = os.getenv("INGEST_JOB_DIR", os.path.join(".cache", "ingest_jobs"))  # Job state as JSON
+INGEST_JOB_HISTORY = 100  # Finished jobs kept on disk
+INGEST_JOB_POLL_SECONDS = 2  # Sidebar refresh interval while jobs run
+
+# Vector store settings
+VECTOR_BUFFER_INITIAL_CAPACITY = 1024  # Rows preallocated for embeddings
+INGEST_TIMINGS_HISTORY = 50  # Per-batch ingest timings kept for stats
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", "vector_index")  # Persisted knowledge base
+VECTOR_STORE_GENERATIONS_KEPT = 2  # Saved generations kept on disk; each save writes a new one
+
+# Index settings: the store starts as an exact flat index and switches to
+# INDEX_TYPE ("flat", "ivf_flat", "hnsw" or "ivf_pq") once it is large enough
+INDEX_TYPE = "ivf_flat"
+ANN_TRAIN_THRESHOLD = 50000  # Chunks needed before building the ANN index
+ANN_RETRAIN_FACTOR = 4  # Retrain IVF indexes when the corpus grows this much
+ANN_MAX_TRAINING_POINTS = 100000  # Sample size used to train IVF/PQ indexes
+HNSW_M = 32
+TOMBSTONE_COMPACT_RATIO = 0.2  # Compact the store and rebuild its index once removed chunks make up this much of it
+PQ_SUBQUANTIZERS = 16
+
+# Per search mode accuracy/speed knobs for ANN indexes
+DEFAULT_SEARCH_MODE = "⚡ Standard"
+SEARCH_MODE_PARAMS = {
+    "🔥 Fast": {"nprobe": 4, "ef_search": 32},
+    "⚡ Standard": {"nprobe": 16, "ef_search": 64},
+    "🔍 Deep": {"nprobe": 64, "ef_search": 256}
+}
+
+# Embedding cache settings
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(".cache", "embeddings.sqlite3"))
+EMBEDDING_CACHE_MAX_ENTRIES = 200000  # Least recently used entries are evicted beyond this
 
 # Search settings
 MAX_SEARCH_RESULTS = 5
 PDF_SEARCH_RESULTS = 3
 WEB_SEARCH_RESULTS = 3
 SIMILARITY_THRESHOLD = 0.3
+
+# Retrieval deadlines (seconds); sources that miss them are left out of the answer
+PDF_SEARCH_TIMEOUT = 5.0
+WEB_SEARCH_TIMEOUT = 12.0
+RETRIEVAL_WORKERS = 16  # Threads shared by all sessions for concurrent searches
+
+# Web search settings
+WEB_REQUEST_TIMEOUT = 10
+WEB_MAX_CONNECTIONS = 20  # Pooled connections shared by all sessions
+WEB_MAX_KEEPALIVE = 10
+WEB_CACHE_TTL = 3600  # Seconds a query's results are reused
+WEB_CACHE_MAX_ENTRIES = 1000
+WEB_CACHE_PATH = os.getenv("WEB_CACHE_PATH")  # Set to persist the cache across restarts
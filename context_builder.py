@@ -0,0 +1,117 @@
+import math
+import re
+from typing import List, Dict, Tuple, Union
+from config import (
+    MAX_TOKENS, MODEL_CONTEXT_WINDOWS, DEFAULT_CONTEXT_WINDOW, CONTEXT_BUDGET_RATIO, PROMPT_RESERVED_TOKENS,
+    CHARS_PER_TOKEN, DEFAULT_CHARS_PER_TOKEN, CONTEXT_DEDUP_THRESHOLD
+)
+
+PDF_HEADER = "=== INFORMATION FROM PDF DOCUMENTS ==="
+WEB_HEADER = "\n=== INFORMATION FROM WEB SOURCES ==="
+
+_WORD_RE = re.compile(r'\w+')
+
+def context_window(model: str) -> int:
+    """Get the context window of a model in tokens"""
+    return MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+
+def estimate_tokens(text: str, model: str = "") -> int:
+    """Approximate how many tokens text takes in the model's tokenizer"""
+    chars_per_token = next(
+        (ratio for prefix, ratio in CHARS_PER_TOKEN.items() if model.startswith(prefix)),
+        DEFAULT_CHARS_PER_TOKEN
+    )
+    return math.ceil(len(text) / chars_per_token)
+
+def context_budget(model: str, question: str = "", max_tokens: int = MAX_TOKENS,
+                   budget_ratio: float = CONTEXT_BUDGET_RATIO) -> int:
+    """Tokens available for sources once the prompt and the completion are accounted for"""
+    window = context_window(model)
+    remaining = window - max_tokens - PROMPT_RESERVED_TOKENS - estimate_tokens(question, model)
+    return max(0, min(int(window * budget_ratio), remaining))
+
+def _is_duplicate(words: set, selected: List[dict], threshold: float) -> bool:
+    """Whether most words of a source already appear in one that was selected"""
+    if not words:
+        return False
+    for item in selected:
+        if item["words"] and len(words & item["words"]) / min(len(words), len(item["words"])) >= threshold:
+            return True
+    return False
+
+def build_context(pdf_context: List[Union[str, Tuple[str, float]]] = None, web_context: List[Dict] = None,
+                  model: str = "", budget: int = None, question: str = "",
+                  dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD) -> Tuple[str, Dict]:
+    """Pack the best sources into a token budget.
+
+    pdf_context items are texts in rank order or (text, score) pairs. Sources
+    are taken alternately from the PDF and web lists, best first, skipping
+    near-duplicates and anything that no longer fits. Returns the context
+    string and a stats dict with used/dropped token counts.
+    """
+    if budget is None:
+        budget = context_budget(model, question)
+    
+    pdf_items = []
+    for rank, item in enumerate(pdf_context or []):
+        text, score = item if isinstance(item, tuple) else (item, None)
+        pdf_items.append({"source": "pdf", "text": text, "score": score, "order": rank})
+    if pdf_items and all(item["score"] is not None for item in pdf_items):
+        pdf_items.sort(key=lambda item: -item["score"])
+    
+    web_items = [
+        {"source": "web", "result": result, "text": f"{result['title']}: {result['snippet']}", "order": rank}
+        for rank, result in enumerate(web_context or [])
+    ]
+    
+    # Alternate sources so one long list cannot crowd out the other
+    candidates = []
+    for position in range(max(len(pdf_items), len(web_items))):
+        candidates.extend(items[position] for items in (pdf_items, web_items) if position < len(items))
+    
+    header_tokens = {"pdf": estimate_tokens(PDF_HEADER, model) + 1, "web": estimate_tokens(WEB_HEADER, model) + 1}
+    selected = []
+    used_tokens = 0
+    dropped_tokens = 0
+    duplicates = 0
+    for item in candidates:
+        if item["source"] == "pdf":
+            item["body"] = f": {item['text']}"
+        else:
+            result = item["result"]
+            item["body"] = f" - {result['title']}: {result['snippet']}"
+            if result.get('url'):
+                item["body"] += f"\nURL: {result['url']}"
+        # "PDF Source NN" / "Web Source NN" label plus the newline
+        item["tokens"] = estimate_tokens(item["body"], model) + estimate_tokens("Web Source 00", model) + 1
+        item["words"] = set(_WORD_RE.findall(item["text"].lower()))
+        
+        if _is_duplicate(item["words"], selected, dedup_threshold):
+            duplicates += 1
+            dropped_tokens += item["tokens"]
+            continue
+        
+        cost = item["tokens"]
+        if not any(chosen["source"] == item["source"] for chosen in selected):
+            cost += header_tokens[item["source"]]
+        if used_tokens + cost > budget:
+            dropped_tokens += item["tokens"]
+            continue
+        
+        selected.append(item)
+        used_tokens += cost
+    
+    # Lay the chosen sources out in their original order, PDFs first
+    context_parts = []
+    stats = {"budget": budget, "used_tokens": used_tokens, "dropped_tokens": dropped_tokens, "duplicates": duplicates}
+    for source, label, header in (("pdf", "PDF", PDF_HEADER), ("web", "Web", WEB_HEADER)):
+        chosen = sorted((item for item in selected if item["source"] == source), key=lambda item: item["order"])
+        total = len(pdf_items) if source == "pdf" else len(web_items)
+        stats[f"{source}_used"] = len(chosen)
+        stats[f"{source}_dropped"] = total - len(chosen)
+        if chosen:
+            context_parts.append(header)
+            for i, item in enumerate(chosen, 1):
+                context_parts.append(f"{label} Source {i}{item['body']}")
+    
+    return "\n".join(context_parts), stats
@@ -0,0 +1,139 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from typing import List, Optional
+from config import EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES
+
+# SQLite limits the number of bound parameters per statement
+SQL_BATCH_SIZE = 500
+
+class EmbeddingCache:
+    """Persistent embedding cache keyed by hash(model name, chunk text)"""
+    
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_access ON embeddings (last_access)")
+        self._conn.commit()
+    
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        """Hash the model name and whitespace-normalized text"""
+        normalized = " ".join(text.split())
+        return hashlib.sha256(f"{model_name}\x00{normalized}".encode("utf-8")).hexdigest()
+    
+    def get_many(self, model_name: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Look up embeddings for texts; missing entries are None"""
+        keys = [self.make_key(model_name, text) for text in texts]
+        found = {}
+        
+        with self._lock:
+            for start in range(0, len(keys), SQL_BATCH_SIZE):
+                batch = keys[start:start + SQL_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update(rows)
+            
+            # Touch hits so eviction drops the least recently used entries
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+            
+            results = []
+            for key in keys:
+                blob = found.get(key)
+                if blob is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    results.append(np.frombuffer(blob, dtype='float32'))
+        
+        return results
+    
+    def put_many(self, model_name: str, texts: List[str], embeddings: np.ndarray):
+        """Store embeddings for texts and evict old entries if over capacity"""
+        now = time.time()
+        rows = [
+            (self.make_key(model_name, text), np.asarray(vector, dtype='float32').tobytes(), now)
+            for text, vector in zip(texts, embeddings)
+        ]
+        
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)", rows
+            )
+            self._evict()
+            self._conn.commit()
+    
+    def _evict(self):
+        """Drop least recently used entries beyond max_entries"""
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = count - self.max_entries
+        if excess <= 0:
+            return
+        
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+            (excess,)
+        )
+        self.evictions += excess
+    
+    def clear(self):
+        """Remove every cached embedding"""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+    
+    def get_stats(self) -> dict:
+        """Get hit/miss counters and size of the cache"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "max_entries": self.max_entries
+        }
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Get the process-wide embedding cache"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = EmbeddingCache()
+        return _shared_cache
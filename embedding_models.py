@@ -0,0 +1,68 @@
+import threading
+from typing import Dict, Optional, Tuple
+from sentence_transformers import SentenceTransformer
+import streamlit as st
+from config import EMBEDDING_MODEL, FALLBACK_EMBEDDING_MODEL, EMBEDDING_MAX_TOKENS
+
+# Loaded models shared by every session in this process, keyed by requested name
+_models: Dict[str, Tuple[SentenceTransformer, str]] = {}
+_models_lock = threading.Lock()
+_warm_up_started = set()
+
+def get_embedding_model(model_name: str = EMBEDDING_MODEL) -> Tuple[SentenceTransformer, str]:
+    """Get the shared model for model_name, loading it once per process.
+
+    Returns the model and the name it was actually loaded as, which differs
+    from model_name when loading fell back to the default model.
+    """
+    entry = _models.get(model_name)
+    if entry is not None:
+        return entry
+    
+    with _models_lock:
+        # Another session may have finished loading while we waited
+        entry = _models.get(model_name)
+        if entry is not None:
+            return entry
+        
+        try:
+            entry = (SentenceTransformer(model_name), model_name)
+        except Exception as e:
+            st.error(f"Error loading embedding model: {e}")
+            # Fallback to a smaller model
+            entry = (SentenceTransformer(FALLBACK_EMBEDDING_MODEL), FALLBACK_EMBEDDING_MODEL)
+        
+        _models[model_name] = entry
+        return entry
+
+def get_tokenizer(model_name: str = EMBEDDING_MODEL) -> Tuple[Optional[object], int, str]:
+    """Get the shared model's tokenizer, how many text tokens one input may hold, and the model name.
+
+    Inputs longer than the model's max_seq_length are silently truncated when
+    embedded, so the limit excludes the special tokens the tokenizer adds.
+    The tokenizer is None if the model does not expose one.
+    """
+    model, loaded_name = get_embedding_model(model_name)
+    tokenizer = getattr(model, "tokenizer", None)
+    max_seq_length = getattr(model, "max_seq_length", None) or EMBEDDING_MAX_TOKENS
+    
+    special_tokens = 2
+    if tokenizer is not None:
+        try:
+            special_tokens = tokenizer.num_special_tokens_to_add(pair=False)
+        except Exception:
+            pass
+    return tokenizer, max_seq_length - special_tokens, loaded_name
+
+def warm_up_embedding_model(model_name: str = EMBEDDING_MODEL):
+    """Load the model in the background once per process so the first query is fast"""
+    with _models_lock:
+        if model_name in _models or model_name in _warm_up_started:
+            return
+        _warm_up_started.add(model_name)
+    
+    def _warm_up():
+        model, _ = get_embedding_model(model_name)
+        model.encode(["warm up"], show_progress_bar=False)
+    
+    threading.Thread(target=_warm_up, name=f"warm-up-{model_name}", daemon=True).start()
@@ -1,8 +1,39 @@
 
-from groq import Groq
+from groq import Groq, AsyncGroq
 import streamlit as st
-from typing import List, Dict, Optional
-from config import GROQ_API_KEY, GROQ_MODEL, MAX_TOKENS, TEMPERATURE
+import asyncio
+import re
+import weakref
+import httpx
+from types import SimpleNamespace
+from typing import AsyncIterator, List, Dict, Optional, Tuple
+from config import GROQ_API_KEY, GROQ_MODEL, MAX_TOKENS, TEMPERATURE, SEMANTIC_CACHE_ENABLED, RESPONSE_CACHE_ENABLED, AVAILABLE_MODELS
+from config import GROQ_MAX_CONCURRENCY, GROQ_MAX_CONNECTIONS, GROQ_MAX_KEEPALIVE, GROQ_REQUEST_TIMEOUT
+from semantic_cache import get_semantic_cache
+from response_cache import get_response_cache
+from context_builder import context_budget
+from prompt_builder import build_messages, build_summary_messages
+from model_health import get_model_health
+from resilience import call_with_fallback, acall_with_fallback
+
+def _stream_chunk(content: str):
+    """Build an object shaped like a Groq streaming chunk"""
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+def replay_stream(answer: str):
+    """Replay a cached answer word by word in the streaming chunk format"""
+    for piece in re.findall(r'\S+\s*|\s+', answer):
+        yield _stream_chunk(piece)
+
+def record_stream(stream, on_complete):
+    """Pass chunks through and hand the full text to on_complete once the stream ends"""
+    parts = []
+    for chunk in stream:
+        content = chunk.choices[0].delta.content
+        if content is not None:
+            parts.append(content)
+        yield chunk
+    on_complete("".join(parts))
 
 class GroqHandler:
     def __init__(self):
@@ -19,6 +50,102 @@ class GroqHandler:
         except Exception as e:
             st.error(f"Error initializing Groq client: {str(e)}")
             st.stop()
+        
+        self.last_context_stats = {}
+        
+        # Model availability is probed in the background and read from cache on reruns
+        self.model_health = get_model_health(self.validate_model)
+        self.model_health.refresh(AVAILABLE_MODELS.values())
+        
+        # Paraphrased questions over the same sources reuse earlier answers
+        self.semantic_cache = None
+        self.last_response_cached = False
+        if SEMANTIC_CACHE_ENABLED:
+            try:
+                self.semantic_cache = get_semantic_cache()
+            except Exception as e:
+                st.warning(f"Semantic answer cache unavailable: {str(e)}")
+        
+        # Byte-identical requests are answered without calling the API at all
+        self.response_cache = None
+        if RESPONSE_CACHE_ENABLED:
+            try:
+                self.response_cache = get_response_cache()
+            except Exception as e:
+                st.warning(f"Response cache unavailable: {str(e)}")
+    
+    def _lookup_response(self, messages: List[Dict]):
+        """Get (request key, cached response or None) for an exact request"""
+        if self.response_cache is None:
+            return None, None
+        try:
+            key = self.response_cache.make_key(self.model, self.temperature, self.max_tokens, messages)
+            return key, self.response_cache.get(key)
+        except Exception:
+            return None, None
+    
+    def _store_response(self, key: str, answer: str):
+        """Remember a response in the exact-match cache"""
+        if self.response_cache is None or key is None:
+            return
+        try:
+            self.response_cache.set(key, answer)
+        except Exception:
+            pass
+    
+    def _lookup_cached_answer(self, question: str, pdf_context: List[str] = None, web_context: List[Dict] = None):
+        """Get (fingerprint, cached answer or None) for a question"""
+        if self.semantic_cache is None:
+            return None, None
+        try:
+            fingerprint = self.semantic_cache.context_fingerprint(self.model, pdf_context, web_context)
+            return fingerprint, self.semantic_cache.lookup(question, fingerprint)
+        except Exception:
+            return None, None
+    
+    def _store_answer(self, question: str, fingerprint: str, answer: str):
+        """Remember an answer in the semantic cache"""
+        if self.semantic_cache is None or fingerprint is None:
+            return
+        try:
+            self.semantic_cache.store(question, fingerprint, answer)
+        except Exception:
+            pass
+    
+    def _pack_messages(self, question: str, pdf_context: List[str] = None, web_context: List[Dict] = None,
+                       model: str = None) -> Tuple[List[Dict], Dict]:
+        """Build the chat messages within a model's context budget; returns (messages, token counts)"""
+        model = model or self.model
+        budget = context_budget(model, question, self.max_tokens)
+        return build_messages(question, pdf_context, web_context, model, budget)
+    
+    def _build_messages(self, question: str, pdf_context: List[str] = None, web_context: List[Dict] = None,
+                        model: str = None) -> List[Dict]:
+        """Build the chat messages within a model's context budget and record the token counts"""
+        messages, self.last_context_stats = self._pack_messages(question, pdf_context, web_context, model)
+        return messages
+    
+    def _create_completion(self, messages: List[Dict], question: str, pdf_context: List[str] = None,
+                           web_context: List[Dict] = None, stream: bool = False):
+        """Call the API with retries and model fallback; returns (response, model used)"""
+        requested_model = self.model
+        
+        def create(model: str):
+            # Fallback models may have smaller windows, so their prompt is packed again
+            model_messages = messages if model == requested_model else self._build_messages(question, pdf_context, web_context, model)
+            return self.client.chat.completions.create(
+                messages=model_messages,
+                model=model,
+                max_tokens=self.max_tokens,
+                temperature=self.temperature,
+                stream=stream
+            )
+        
+        response, model = call_with_fallback(create, requested_model, health=self.model_health)
+        if model != requested_model:
+            st.warning(f"Model {requested_model} failed, answered with {model}")
+            self.model = model
+        return response, model
     
     def test_connection(self) -> bool:
         """Test if Groq API is working"""
@@ -58,27 +185,26 @@ class GroqHandler:
             "Llama3 70B (Most Powerful)": "llama3-70b-8192"
         }
         
-        progress_bar = st.progress(0)
         st.info("🔍 Testing model availability...")
+        # Probed concurrently; fresh results from earlier probes are reused
+        availability = self.model_health.check(test_models.values())
         
-        for i, (name, model_id) in enumerate(test_models.items()):
-            progress_bar.progress((i + 1) / len(test_models))
-            
-            if self.validate_model(model_id):
+        for name, model_id in test_models.items():
+            if availability[model_id]:
                 working_models[name] = model_id
                 st.success(f"✅ {name} - Available")
             else:
                 st.warning(f"❌ {name} - Not available")
         
-        progress_bar.empty()
         return working_models
     
     def auto_select_working_model(self) -> str:
         """Automatically select a working model"""
         test_models = ["llama3-8b-8192", "llama3-70b-8192"]
         
+        availability = self.model_health.check(test_models)
         for model in test_models:
-            if self.validate_model(model):
+            if availability[model]:
                 st.success(f"✅ Auto-selected working model: {model}")
                 return model
         
@@ -89,73 +215,30 @@ class GroqHandler:
     def generate_answer(self, question: str, pdf_context: List[str] = None, web_context: List[Dict] = None) -> str:
         """Generate comprehensive answer using Groq API"""
         
-        # Build context from PDF and web sources
-        context_parts = []
+        request_model = self.model
+        # Sources are packed best first within the model's budget
+        messages = self._build_messages(question, pdf_context, web_context)
         
-        if pdf_context:
-            context_parts.append("=== INFORMATION FROM PDF DOCUMENTS ===")
-            for i, text in enumerate(pdf_context, 1):
-                context_parts.append(f"PDF Source {i}: {text}")
+        # Exact repeats are cheapest to check, then paraphrases over the same sources
+        request_key, cached_answer = self._lookup_response(messages)
+        fingerprint = None
+        if cached_answer is None:
+            fingerprint, cached_answer = self._lookup_cached_answer(question, pdf_context, web_context)
+        self.last_response_cached = cached_answer is not None
+        if cached_answer is not None:
+            return cached_answer
         
-        if web_context:
-            context_parts.append("\n=== INFORMATION FROM WEB SOURCES ===")
-            for i, result in enumerate(web_context, 1):
-                context_parts.append(f"Web Source {i} - {result['title']}: {result['snippet']}")
-                if result.get('url'):
-                    context_parts.append(f"URL: {result['url']}")
-        
-        context = "\n".join(context_parts)
-        
-        # Create system prompt
-        system_prompt = """You are a helpful AI assistant that answers questions based on provided context from PDF documents and web sources. 
-
-Instructions:
-1. Use the provided context to answer the question accurately
-2. If information comes from PDFs, mention "According to the PDF documents..."
-3. If information comes from web sources, mention "According to web sources..."
-4. If you use both sources, clearly distinguish between them
-5. If the context doesn't contain enough information, say so and provide what you can
-6. Be concise but comprehensive
-7. Always cite your sources when possible
-8. Format your response clearly with proper sections if needed"""
-
-        # Create user prompt
-        if context:
-            user_prompt = f"""Context Information:
-{context}
-
-Question: {question}
-
-Please provide a comprehensive answer based on the available context."""
-        else:
-            user_prompt = f"""Question: {question}
-
-Please provide a helpful answer to this question. Since no specific context is provided, use your general knowledge but mention that the answer is based on general knowledge."""
-
         try:
-            # Make API call to Groq
-            chat_completion = self.client.chat.completions.create(
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                model=self.model,
-                max_tokens=self.max_tokens,
-                temperature=self.temperature,
-                stream=False
-            )
+            # Transient errors are retried with backoff; failing models fall back along the chain
+            chat_completion, model = self._create_completion(messages, question, pdf_context, web_context)
             
-            return chat_completion.choices[0].message.content
+            answer = chat_completion.choices[0].message.content
+            if model == request_model:
+                self._store_response(request_key, answer)
+                self._store_answer(question, fingerprint, answer)
+            return answer
             
         except Exception as e:
-            # If current model fails, try to auto-select working model
-            if "model" in str(e).lower() or "not found" in str(e).lower():
-                st.warning(f"Model {self.model} failed, trying to find working model...")
-                working_model = self.auto_select_working_model()
-                if working_model != self.model:
-                    self.model = working_model
-                    return self.generate_answer(question, pdf_context, web_context)
-            
             st.error(f"Groq API Error: {str(e)}")
             return "Sorry, I encountered an error while generating the response. The model might be temporarily unavailable. Please try again or switch to a different model."
     
@@ -164,17 +247,9 @@ Please provide a helpful answer to this question. Since no specific context is p
         if len(text) <= max_length:
             return text
         
-        prompt = f"""Please summarize the following text in about {max_length} characters while keeping the key information:
-
-{text}
-
-Summary:"""
-        
         try:
             chat_completion = self.client.chat.completions.create(
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
+                messages=build_summary_messages(text, max_length),
                 model=self.model,
                 max_tokens=100,
                 temperature=0.3,
@@ -189,85 +264,161 @@ Summary:"""
     def stream_response(self, question: str, pdf_context: List[str] = None, web_context: List[Dict] = None):
         """Stream response from Groq API for real-time display"""
         
-        # Build context (same as generate_answer)
-        context_parts = []
-        
-        if pdf_context:
-            context_parts.append("=== INFORMATION FROM PDF DOCUMENTS ===")
-            for i, text in enumerate(pdf_context, 1):
-                context_parts.append(f"PDF Source {i}: {text}")
-        
-        if web_context:
-            context_parts.append("\n=== INFORMATION FROM WEB SOURCES ===")
-            for i, result in enumerate(web_context, 1):
-                context_parts.append(f"Web Source {i} - {result['title']}: {result['snippet']}")
-                if result.get('url'):
-                    context_parts.append(f"URL: {result['url']}")
+        request_model = self.model
+        # Sources are packed best first within the model's budget
+        messages = self._build_messages(question, pdf_context, web_context)
         
-        context = "\n".join(context_parts)
+        request_key, cached_answer = self._lookup_response(messages)
+        fingerprint = None
+        if cached_answer is None:
+            fingerprint, cached_answer = self._lookup_cached_answer(question, pdf_context, web_context)
+        self.last_response_cached = cached_answer is not None
+        if cached_answer is not None:
+            return replay_stream(cached_answer)
         
-        system_prompt = """You are a helpful AI assistant that answers questions based on provided context from PDF documents and web sources. 
-
-Instructions:
-1. Use the provided context to answer the question accurately
-2. If information comes from PDFs, mention "According to the PDF documents..."
-3. If information comes from web sources, mention "According to web sources..."
-4. If you use both sources, clearly distinguish between them
-5. If the context doesn't contain enough information, say so and provide what you can
-6. Be concise but comprehensive
-7. Always cite your sources when possible
-8. Format your response clearly with proper sections if needed"""
-
-        if context:
-            user_prompt = f"""Context Information:
-{context}
-
-Question: {question}
-
-Please provide a comprehensive answer based on the available context."""
-        else:
-            user_prompt = f"""Question: {question}
-
-Please provide a helpful answer to this question. Since no specific context is provided, use your general knowledge but mention that the answer is based on general knowledge."""
-
         try:
             # Stream response
-            stream = self.client.chat.completions.create(
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                model=self.model,
-                max_tokens=self.max_tokens,
-                temperature=self.temperature,
-                stream=True
-            )
+            stream, model = self._create_completion(messages, question, pdf_context, web_context, stream=True)
+            if model != request_model:
+                return stream
             
-            return stream
+            def remember(answer: str):
+                self._store_response(request_key, answer)
+                self._store_answer(question, fingerprint, answer)
             
-        except Exception as e:
-            # If current model fails, try to auto-select working model
-            if "model" in str(e).lower() or "not found" in str(e).lower():
-                st.warning(f"Model {self.model} failed, trying to find working model...")
-                working_model = self.auto_select_working_model()
-                if working_model != self.model:
-                    self.model = working_model
-                    return self.stream_response(question, pdf_context, web_context)
+            return record_stream(stream, remember)
             
+        except Exception as e:
             st.error(f"Groq API Error: {str(e)}")
             return None
     
     def update_settings(self, model: str = None, temperature: float = None, max_tokens: int = None):
         """Update Groq settings"""
-        if model:
-            # Validate model before setting it
-            if self.validate_model(model):
+        if model and model != self.model:
+            # Cached status only; unknown models are accepted while a background probe checks them
+            if self.model_health.status(model) is False:
+                st.error(f"❌ Model {model} is not available. Keeping current model: {self.model}")
+            else:
                 self.model = model
                 st.success(f"✅ Model updated to: {model}")
-            else:
-                st.error(f"❌ Model {model} is not available. Keeping current model: {self.model}")
         
         if temperature is not None:
             self.temperature = temperature
         if max_tokens:
             self.max_tokens = max_tokens
+
+# One async client (and connection pool) plus one concurrency limit per event loop
+_async_clients = weakref.WeakKeyDictionary()
+
+def _get_async_client():
+    """Get the (AsyncGroq client, semaphore) shared by every handler on the running loop"""
+    loop = asyncio.get_running_loop()
+    entry = _async_clients.get(loop)
+    if entry is None:
+        http_client = httpx.AsyncClient(
+            timeout=GROQ_REQUEST_TIMEOUT,
+            limits=httpx.Limits(max_connections=GROQ_MAX_CONNECTIONS, max_keepalive_connections=GROQ_MAX_KEEPALIVE)
+        )
+        entry = (AsyncGroq(api_key=GROQ_API_KEY, http_client=http_client), asyncio.Semaphore(GROQ_MAX_CONCURRENCY))
+        _async_clients[loop] = entry
+    return entry
+
+class AsyncGroqHandler(GroqHandler):
+    """GroqHandler variant that serves many concurrent questions on one event loop"""
+    
+    def _async_create(self, client, messages: List[Dict], question: str, pdf_context: List[str] = None,
+                      web_context: List[Dict] = None, stream: bool = False):
+        requested_model = self.model
+        
+        async def create(model: str):
+            model_messages = messages if model == requested_model else self._pack_messages(question, pdf_context, web_context, model)[0]
+            return await client.chat.completions.create(
+                messages=model_messages,
+                model=model,
+                max_tokens=self.max_tokens,
+                temperature=self.temperature,
+                stream=stream
+            )
+        
+        return create
+    
+    async def _alookup(self, question: str, messages: List[Dict], pdf_context: List[str] = None,
+                       web_context: List[Dict] = None):
+        """Get (request key, fingerprint, cached answer or None), reading the caches off the loop"""
+        request_key, cached_answer = await asyncio.to_thread(self._lookup_response, messages)
+        fingerprint = None
+        if cached_answer is None:
+            fingerprint, cached_answer = await asyncio.to_thread(self._lookup_cached_answer, question, pdf_context, web_context)
+        return request_key, fingerprint, cached_answer
+    
+    async def _aremember(self, request_key: str, question: str, fingerprint: str, answer: str):
+        await asyncio.to_thread(self._store_response, request_key, answer)
+        await asyncio.to_thread(self._store_answer, question, fingerprint, answer)
+    
+    async def agenerate_answer(self, question: str, pdf_context: List[str] = None,
+                               web_context: List[Dict] = None) -> Tuple[str, Dict]:
+        """Generate an answer without blocking the event loop; returns (answer, context token counts).
+
+        The counts are returned rather than kept on the handler, which serves
+        overlapping requests. API errors are raised to the caller.
+        """
+        request_model = self.model
+        messages, context_stats = self._pack_messages(question, pdf_context, web_context)
+        request_key, fingerprint, cached_answer = await self._alookup(question, messages, pdf_context, web_context)
+        if cached_answer is not None:
+            return cached_answer, context_stats
+        
+        client, semaphore = _get_async_client()
+        create = self._async_create(client, messages, question, pdf_context, web_context)
+        
+        async def limited_create(model: str):
+            # Only in-flight requests hold a slot, not backoff waits
+            async with semaphore:
+                return await create(model)
+        
+        chat_completion, model = await acall_with_fallback(limited_create, request_model, health=self.model_health)
+        answer = chat_completion.choices[0].message.content
+        if model == request_model:
+            await self._aremember(request_key, question, fingerprint, answer)
+        return answer, context_stats
+    
+    async def astream_response(self, question: str, pdf_context: List[str] = None,
+                               web_context: List[Dict] = None) -> Tuple[AsyncIterator, Dict]:
+        """Get (async iterator over streaming chunks in the same format as stream_response, context token counts)"""
+        messages, context_stats = self._pack_messages(question, pdf_context, web_context)
+        return self._astream(self.model, question, messages, pdf_context, web_context), context_stats
+    
+    async def _astream(self, request_model: str, question: str, messages: List[Dict], pdf_context: List[str] = None,
+                       web_context: List[Dict] = None) -> AsyncIterator:
+        request_key, fingerprint, cached_answer = await self._alookup(question, messages, pdf_context, web_context)
+        if cached_answer is not None:
+            for chunk in replay_stream(cached_answer):
+                yield chunk
+            return
+        
+        client, semaphore = _get_async_client()
+        create = self._async_create(client, messages, question, pdf_context, web_context, stream=True)
+        
+        async def limited_create(model: str):
+            # A slot per attempt, so backoff waits between attempts hold none
+            await semaphore.acquire()
+            try:
+                return await create(model)
+            except BaseException:
+                semaphore.release()
+                raise
+        
+        stream, model = await acall_with_fallback(limited_create, request_model, health=self.model_health)
+        parts = []
+        try:
+            async for chunk in stream:
+                content = chunk.choices[0].delta.content
+                if content is not None:
+                    parts.append(content)
+                yield chunk
+        finally:
+            # The winning attempt's slot is held until the stream is drained or closed, since the connection stays busy
+            semaphore.release()
+        
+        if model == request_model:
+            await self._aremember(request_key, question, fingerprint, "".join(parts))
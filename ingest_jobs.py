@@ -0,0 +1,292 @@
+import io
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+import PyPDF2
+from ingest_pipeline import IngestPipeline
+from vector_store import get_vector_store
+from config import INGEST_JOB_WORKERS, INGEST_JOB_DIR, INGEST_JOB_HISTORY, VECTOR_STORE_DIR
+
+# Seconds between progress writes of a running job
+STATE_SAVE_INTERVAL = 1.0
+
+logger = logging.getLogger(__name__)
+
+class _Upload(io.BytesIO):
+    """In-memory copy of an uploaded file that outlives the script run"""
+    
+    def __init__(self, data: bytes, name: str):
+        super().__init__(data)
+        self.name = name
+
+class IngestJobManager:
+    """Runs PDF ingest jobs on a fixed pool of worker threads, outside any script run.
+
+    Jobs are queued per user and workers take the next job from each user in
+    turn, so one large upload cannot starve everyone else. Job state is kept
+    as JSON in state_dir so progress survives reruns and restarts; jobs cut
+    short by a restart are reported as interrupted.
+    """
+    
+    def __init__(self, workers: int = INGEST_JOB_WORKERS, state_dir: str = INGEST_JOB_DIR):
+        self.state_dir = state_dir
+        self._jobs = {}  # job id -> public state
+        self._work = {}  # job id -> (files, pdf_processor, vector_store, save_dir, replace_file_id)
+        self._queues = OrderedDict()  # user -> job ids; key order is the round-robin turn
+        self._last_saved = {}
+        self._cond = threading.Condition()
+        self._store_saves = {}  # save dir -> vector store waiting to be saved there
+        self._store_save_cond = threading.Condition()
+        
+        os.makedirs(state_dir, exist_ok=True)
+        self._load_state()
+        
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"ingest-job-{i}", daemon=True) for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+        threading.Thread(target=self._store_saver, name="ingest-store-save", daemon=True).start()
+    
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.state_dir, f"{job_id}.json")
+    
+    def _save(self, job: dict, force: bool = True):
+        """Write a job's state, at most every STATE_SAVE_INTERVAL seconds unless forced"""
+        now = time.time()
+        with self._cond:
+            if not force and now - self._last_saved.get(job["id"], 0) < STATE_SAVE_INTERVAL:
+                return
+            self._last_saved[job["id"]] = now
+            data = json.dumps(job)
+        
+        tmp_path = f"{self._path(job['id'])}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(job["id"]))
+    
+    def _load_state(self):
+        """Read jobs saved by earlier processes, keeping the most recent INGEST_JOB_HISTORY"""
+        jobs = []
+        for name in os.listdir(self.state_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.state_dir, name), encoding="utf-8") as f:
+                    jobs.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        
+        jobs.sort(key=lambda job: job["submitted_at"])
+        for job in jobs[:-INGEST_JOB_HISTORY]:
+            try:
+                os.remove(self._path(job["id"]))
+            except OSError:
+                pass
+        
+        for job in jobs[-INGEST_JOB_HISTORY:]:
+            if job["status"] in ("queued", "running"):
+                # The uploads were only held in the previous process's memory
+                job["status"] = "interrupted"
+                job["finished_at"] = time.time()
+                self._save(job)
+            self._jobs[job["id"]] = job
+    
+    def submit(self, user: str, uploaded_files: List, pdf_processor, vector_store=None,
+               save_dir: str = VECTOR_STORE_DIR, replace_file_id: int = None) -> str:
+        """Queue uploaded files for ingestion into vector_store; returns the job id.
+        
+        vector_store defaults to the process-wide knowledge base saved in
+        save_dir. It must be shared rather than a per-session copy, since each
+        job saves the whole store there when it finishes. replace_file_id, given
+        with a single file, names the stored document that file replaces.
+        """
+        if vector_store is None:
+            vector_store = get_vector_store(save_dir)
+        if replace_file_id is not None and len(uploaded_files) != 1:
+            raise ValueError("A document can only be replaced by a single file")
+        
+        # Copy the bytes now; upload widgets may be gone by the time a worker starts
+        files = []
+        for uploaded_file in uploaded_files:
+            uploaded_file.seek(0)
+            files.append(_Upload(uploaded_file.read(), uploaded_file.name))
+        
+        job = {
+            "id": uuid.uuid4().hex,
+            "user": user,
+            "files": [f.name for f in files],
+            "replace_file_id": replace_file_id,
+            "status": "queued",
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "pages_done": 0,
+            "pages_total": 0,
+            "chunks": 0,
+            "files_done": 0,
+            "results": [],
+            "errors": [],
+            "error": None
+        }
+        
+        with self._cond:
+            self._jobs[job["id"]] = job
+            self._work[job["id"]] = (files, pdf_processor, vector_store, save_dir, replace_file_id)
+            self._queues.setdefault(user, deque()).append(job["id"])
+            self._cond.notify()
+        self._save(job)
+        return job["id"]
+    
+    def save_store(self, vector_store, save_dir: str = VECTOR_STORE_DIR):
+        """Save vector_store to save_dir on a background thread, so a small edit never blocks a script run.
+        
+        Requests made while a save is waiting are folded into it, and saves run one at a time.
+        """
+        with self._store_save_cond:
+            self._store_saves[save_dir] = vector_store
+            self._store_save_cond.notify()
+    
+    def _store_saver(self):
+        while True:
+            with self._store_save_cond:
+                while not self._store_saves:
+                    self._store_save_cond.wait()
+                save_dir, vector_store = self._store_saves.popitem()
+            try:
+                vector_store.save(save_dir)
+            except Exception as e:
+                logger.error("Saving the knowledge base to %s failed: %s", save_dir, e)
+    
+    def _next_job(self) -> str:
+        """Take the oldest job of the user whose turn it is; the caller holds the lock"""
+        user, queue = self._queues.popitem(last=False)
+        job_id = queue.popleft()
+        if queue:
+            self._queues[user] = queue
+        return job_id
+    
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._queues:
+                    self._cond.wait()
+                job_id = self._next_job()
+                job = self._jobs[job_id]
+                files, pdf_processor, vector_store, save_dir, replace_file_id = self._work.pop(job_id)
+                job["status"] = "running"
+                job["started_at"] = time.time()
+            self._save(job)
+            
+            try:
+                status = self._run(job, files, pdf_processor, vector_store, save_dir, replace_file_id)
+                error = None
+            except Exception as e:
+                status, error = "failed", str(e)
+            
+            with self._cond:
+                job["status"] = status
+                job["error"] = error
+                job["finished_at"] = time.time()
+            self._save(job)
+            self._prune_history()
+    
+    def _prune_history(self):
+        """Forget finished jobs beyond the most recent INGEST_JOB_HISTORY, in memory and on disk"""
+        with self._cond:
+            finished = sorted(
+                (job for job in self._jobs.values() if job["status"] not in ("queued", "running")),
+                key=lambda job: job["submitted_at"]
+            )
+            expired = [job["id"] for job in finished[:max(0, len(finished) - INGEST_JOB_HISTORY)]]
+            for job_id in expired:
+                del self._jobs[job_id]
+                self._last_saved.pop(job_id, None)
+        
+        for job_id in expired:
+            try:
+                os.remove(self._path(job_id))
+            except OSError:
+                pass
+    
+    def _run(self, job: dict, files: List, pdf_processor, vector_store, save_dir: str, replace_file_id: int = None) -> str:
+        """Index a job's files and save the store; returns the job's final status"""
+        pages_total = 0
+        for pdf_file in files:
+            try:
+                pages_total += len(PyPDF2.PdfReader(pdf_file).pages)
+            except Exception:
+                pass
+        with self._cond:
+            job["pages_total"] = pages_total
+        
+        pipeline = IngestPipeline(pdf_processor, vector_store)
+        replace_file_ids = {0: replace_file_id} if replace_file_id is not None else None
+        for event in pipeline.run(files, replace_file_ids):
+            if vector_store.detached:
+                # The knowledge base was cleared; closing the run stops the pipeline stages
+                return "cancelled"
+            with self._cond:
+                job["pages_done"] = min(pipeline.pages_extracted, pages_total)
+                if event["type"] == "batch":
+                    job["chunks"] += event["chunks"]
+                elif event["type"] == "error":
+                    job["files_done"] += 1
+                    job["errors"].append(f"{event['file']}: {event['error']}")
+                else:
+                    job["files_done"] += 1
+                    if event["text"]:
+                        job["results"].append({
+                            "name": event["file"],
+                            "file_id": event["file_id"],
+                            "size": len(event["text"]),
+                            "chunks": event["chunks"],
+                            "preview": pdf_processor.get_text_preview(event["text"])
+                        })
+                    else:
+                        job["errors"].append(f"{event['file']}: no text extracted")
+            self._save(job, force=event["type"] != "batch")
+        
+        if job["chunks"]:
+            vector_store.save(save_dir)
+        return "done"
+    
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """Get a snapshot of a job with its progress (0-1) and ETA in seconds"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job = json.loads(json.dumps(job))
+        
+        job["progress"] = 1.0 if job["status"] == "done" else 0.0
+        job["eta_seconds"] = None
+        if job["status"] == "running" and job["pages_total"]:
+            job["progress"] = job["pages_done"] / job["pages_total"]
+            if job["progress"] > 0:
+                elapsed = time.time() - job["started_at"]
+                job["eta_seconds"] = elapsed * (1 - job["progress"]) / job["progress"]
+        return job
+    
+    def list_jobs(self, user: str = None) -> List[Dict]:
+        """Get snapshots of all jobs, or of one user's jobs, oldest first"""
+        with self._cond:
+            job_ids = [job_id for job_id, job in self._jobs.items() if user is None or job["user"] == user]
+        jobs = [self.get_job(job_id) for job_id in job_ids]
+        return sorted((job for job in jobs if job is not None), key=lambda job: job["submitted_at"])
+
+_shared_manager = None
+_shared_manager_lock = threading.Lock()
+
+def get_ingest_jobs() -> IngestJobManager:
+    """Get the process-wide ingest job manager"""
+    global _shared_manager
+    with _shared_manager_lock:
+        if _shared_manager is None:
+            _shared_manager = IngestJobManager()
+        return _shared_manager
@@ -0,0 +1,261 @@
+import queue
+import threading
+from typing import Dict, Iterator, List
+import numpy as np
+from pdf_cache import PDFCache
+from config import INGEST_BATCH_SIZE, INGEST_QUEUE_SIZE, INGEST_FLUSH_SECONDS
+
+_DONE = object()
+
+class PipelineStopped(Exception):
+    """Raised inside a stage when the consumer stopped reading"""
+
+class IngestPipeline:
+    """Streams PDFs into a vector store: extract pages -> chunk -> embed micro-batches -> index.
+
+    Extraction/chunking and embedding run in their own threads connected by
+    bounded queues, so a slow stage makes the earlier ones wait instead of
+    piling text up in memory. Indexing happens in the thread that iterates
+    run(), so each batch is searchable as soon as it is yielded.
+    """
+    
+    def __init__(self, pdf_processor, vector_store, batch_size: int = INGEST_BATCH_SIZE,
+                 queue_size: int = INGEST_QUEUE_SIZE, flush_seconds: float = INGEST_FLUSH_SECONDS):
+        self.pdf_processor = pdf_processor
+        self.vector_store = vector_store
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._chunks = queue.Queue(maxsize=batch_size * queue_size)
+        self._batches = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self.pages_extracted = 0
+    
+    def _put(self, target: queue.Queue, item):
+        """Blocking put that gives up once the pipeline is stopped"""
+        while True:
+            if self._stop.is_set():
+                raise PipelineStopped()
+            try:
+                target.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+    
+    def _extract(self, files: List):
+        """Stage 1: per file, emit chunks as pages are extracted, or the cached entry"""
+        cache = self.pdf_processor.cache
+        model_name = self.vector_store.model_name
+        try:
+            for file_id, pdf_file in enumerate(files):
+                try:
+                    file_hash = None
+                    if cache:
+                        pdf_file.seek(0)
+                        file_hash = PDFCache.hash_bytes(pdf_file.read())
+                        entry = cache.load(file_hash, self.pdf_processor.chunker_id, model_name)
+                        if entry is not None:
+                            self._put(self._chunks, ("cached", file_id, entry, file_hash))
+                            self.pages_extracted += len(entry["pages"])
+                            continue
+                    
+                    pages = []
+                    
+                    def extracted_pages():
+                        for page in self.pdf_processor.iter_pages(pdf_file):
+                            pages.append(page)
+                            self.pages_extracted += 1
+                            yield page
+                    
+                    for chunk in self.pdf_processor.iter_chunk_spans(extracted_pages()):
+                        location = {"page": chunk["page"], "char_offset": chunk["char_start"]}
+                        self._put(self._chunks, ("chunk", file_id, chunk["text"], location))
+                    self._put(self._chunks, ("end", file_id, pages, file_hash))
+                except PipelineStopped:
+                    raise
+                except Exception as e:
+                    self._put(self._chunks, ("error", file_id, e))
+            self._put(self._chunks, _DONE)
+        except PipelineStopped:
+            pass
+    
+    def _embed(self):
+        """Stage 2: encode chunks in micro-batches, flushing early when extraction stalls"""
+        batch = []
+        locations = []
+        batch_file = None
+        
+        def flush():
+            if batch:
+                embeddings = self.vector_store.encode_texts(batch)
+                self._put(self._batches, ("batch", batch_file, list(batch), embeddings, list(locations)))
+                batch.clear()
+                locations.clear()
+        
+        try:
+            while True:
+                try:
+                    item = self._chunks.get(timeout=self.flush_seconds)
+                except queue.Empty:
+                    flush()
+                    continue
+                if item is _DONE:
+                    flush()
+                    self._put(self._batches, _DONE)
+                    return
+                
+                kind, file_id = item[0], item[1]
+                if kind == "chunk":
+                    batch_file = file_id
+                    batch.append(item[2])
+                    locations.append(item[3])
+                    if len(batch) >= self.batch_size:
+                        flush()
+                    continue
+                
+                # Batches never span files, so each file's embeddings can be cached
+                flush()
+                if kind == "cached":
+                    entry, file_hash = item[2], item[3]
+                    if entry["embeddings"] is None and entry["chunks"]:
+                        # Cached under another embedding model
+                        entry["embeddings"] = self.vector_store.encode_texts(entry["chunks"])
+                        self.pdf_processor.cache.save_embeddings(file_hash, self.vector_store.model_name, entry["embeddings"])
+                self._put(self._batches, item)
+        except PipelineStopped:
+            pass
+        except Exception as e:
+            try:
+                self._put(self._batches, ("fatal", None, e))
+            except PipelineStopped:
+                pass
+    
+    def run(self, files: List, replace_file_ids: Dict[int, int] = None) -> Iterator[Dict]:
+        """Index files, yielding progress events as batches become searchable.
+
+        Events are {"type": "batch", "file": name, "chunks": n, "file_chunks": total so far},
+        {"type": "file", "file": name, "file_id": id, "text": ..., "chunks": n} when a file
+        is done, and {"type": "error", "file": name, "error": exception} when one fails,
+        in which case its already indexed chunks are removed again.
+        Each file is registered with the vector store when its first chunks are
+        indexed; file_id is its id there, None if nothing was indexed.
+        replace_file_ids maps positions in files to ids of stored documents they
+        replace; such a file is swapped in whole once it is fully embedded and
+        keeps the old id, and the old document stays if it fails.
+        """
+        files = list(files)
+        replace_file_ids = replace_file_ids or {}
+        workers = [
+            threading.Thread(target=self._extract, args=(files,), name="ingest-extract", daemon=True),
+            threading.Thread(target=self._embed, name="ingest-embed", daemon=True)
+        ]
+        for worker in workers:
+            worker.start()
+        
+        file_chunks = {}
+        file_embeddings = {}
+        file_locations = {}
+        store_ids = {}
+        
+        def store_id(file_id: int) -> int:
+            if file_id not in store_ids:
+                store_ids[file_id] = self.vector_store.add_file(files[file_id].name)
+            return store_ids[file_id]
+        
+        failed = set()
+        
+        def discard(file_id: int):
+            # Drop what was already indexed, so a half-read file leaves nothing searchable;
+            # a file replacing a stored document added nothing yet, so the old one stays
+            file_chunks.pop(file_id, None)
+            file_embeddings.pop(file_id, None)
+            file_locations.pop(file_id, None)
+            if file_id in store_ids:
+                self.vector_store.remove_document(store_ids.pop(file_id))
+        
+        def replace(file_id: int, chunks: List[str], embeddings, locations: List[Dict]):
+            store_ids[file_id] = replace_file_ids[file_id]
+            self.vector_store.replace_document(
+                store_ids[file_id], chunks, embeddings=embeddings, metadata=locations, name=files[file_id].name
+            )
+        
+        try:
+            while True:
+                item = self._batches.get()
+                if item is _DONE:
+                    return
+                kind, file_id = item[0], item[1]
+                if kind == "fatal":
+                    raise item[2]
+                if file_id in failed:
+                    continue
+                name = files[file_id].name
+                
+                if kind == "error":
+                    discard(file_id)
+                    yield {"type": "error", "file": name, "error": item[2]}
+                    continue
+                
+                try:
+                    if kind == "batch":
+                        texts, embeddings, locations = item[2], item[3], item[4]
+                        # A file replacing a stored document is held back until it is complete
+                        if file_id not in replace_file_ids:
+                            metadata = [dict(location, file_id=store_id(file_id)) for location in locations]
+                            self.vector_store.add_texts(texts, embeddings=[embeddings], show_progress=False, metadata=metadata)
+                        file_chunks.setdefault(file_id, []).extend(texts)
+                        file_embeddings.setdefault(file_id, []).append(embeddings)
+                        file_locations.setdefault(file_id, []).extend(locations)
+                        yield {"type": "batch", "file": name, "chunks": len(texts), "file_chunks": len(file_chunks[file_id])}
+                        continue
+                    
+                    if kind == "cached":
+                        entry = item[2]
+                        chunks = entry["chunks"]
+                        locations = [
+                            {"page": page, "char_offset": char_offset}
+                            for page, char_offset in zip(entry["chunk_pages"], entry["chunk_offsets"])
+                        ]
+                        if file_id in replace_file_ids:
+                            if chunks:
+                                replace(file_id, chunks, entry["embeddings"], locations)
+                                yield {"type": "batch", "file": name, "chunks": len(chunks), "file_chunks": len(chunks)}
+                        else:
+                            for start in range(0, len(chunks), self.batch_size):
+                                texts = chunks[start:start + self.batch_size]
+                                metadata = [dict(location, file_id=store_id(file_id)) for location in locations[start:start + self.batch_size]]
+                                self.vector_store.add_texts(
+                                    texts, embeddings=[entry["embeddings"][start:start + self.batch_size]], show_progress=False,
+                                    metadata=metadata
+                                )
+                                yield {"type": "batch", "file": name, "chunks": len(texts), "file_chunks": start + len(texts)}
+                        yield {"type": "file", "file": name, "file_id": store_ids.get(file_id), "text": entry["text"], "chunks": len(chunks)}
+                        continue
+                    
+                    # kind == "end": the file is fully indexed, so cache what was built
+                    pages, file_hash = item[2], item[3]
+                    text = "\n".join(page_text for _, page_text in pages).strip()
+                    chunks = file_chunks.pop(file_id, [])
+                    embeddings = file_embeddings.pop(file_id, [])
+                    locations = file_locations.pop(file_id, [])
+                    cache = self.pdf_processor.cache
+                    if cache and text:
+                        cache.save(file_hash, {
+                            "pages": pages, "chunks": chunks, "chunker": self.pdf_processor.chunker_id,
+                            "chunk_pages": [location["page"] for location in locations],
+                            "chunk_offsets": [location["char_offset"] for location in locations]
+                        })
+                        if embeddings:
+                            cache.save_embeddings(file_hash, self.vector_store.model_name, np.vstack(embeddings))
+                    if file_id in replace_file_ids and chunks:
+                        replace(file_id, chunks, np.vstack(embeddings), locations)
+                    yield {"type": "file", "file": name, "file_id": store_ids.get(file_id), "text": text, "chunks": len(chunks)}
+                except Exception as e:
+                    # An indexing failure drops the file like an extraction failure; its remaining items are skipped
+                    discard(file_id)
+                    failed.add(file_id)
+                    yield {"type": "error", "file": name, "error": e}
+        finally:
+            # Unblocks the stages if the consumer stops early
+            self._stop.set()
+            for worker in workers:
+                worker.join(timeout=1.0)
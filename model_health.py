@@ -0,0 +1,103 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Optional
+from config import MODEL_HEALTH_TTL, MODEL_PROBE_WORKERS, MODEL_PROBE_TIMEOUT
+
+class ModelHealthRegistry:
+    """Cached model availability, refreshed by concurrent background probes"""
+    
+    def __init__(self, probe: Callable[[str], bool], ttl_seconds: float = MODEL_HEALTH_TTL,
+                 workers: int = MODEL_PROBE_WORKERS):
+        self.probe = probe
+        self.ttl_seconds = ttl_seconds
+        self.probes = 0
+        self._status = {}  # model -> (available, checked_at)
+        self._pending = {}  # model -> Future of a running probe
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="model-probe")
+    
+    def _is_fresh(self, model: str) -> bool:
+        entry = self._status.get(model)
+        return entry is not None and time.time() - entry[1] < self.ttl_seconds
+    
+    def _probe(self, model: str) -> bool:
+        try:
+            available = bool(self.probe(model))
+        except Exception:
+            available = False
+        with self._lock:
+            self.probes += 1
+            self._status[model] = (available, time.time())
+            self._pending.pop(model, None)
+        return available
+    
+    def record(self, model: str, available: bool):
+        """Record availability seen by a real request, saving a probe"""
+        with self._lock:
+            self._status[model] = (available, time.time())
+    
+    def refresh(self, models: Iterable[str], force: bool = False) -> Dict[str, Future]:
+        """Probe stale models in the background; returns futures for the probes started or already running"""
+        futures = {}
+        with self._lock:
+            for model in models:
+                if not force and self._is_fresh(model):
+                    continue
+                future = self._pending.get(model)
+                if future is None:
+                    future = self._executor.submit(self._probe, model)
+                    self._pending[model] = future
+                futures[model] = future
+        return futures
+    
+    def status(self, model: str) -> Optional[bool]:
+        """Last known availability without any network round trip; None if never checked.
+
+        A stale entry is still returned while a background probe refreshes it.
+        """
+        with self._lock:
+            entry = self._status.get(model)
+            fresh = self._is_fresh(model)
+        if not fresh:
+            self.refresh([model])
+        return None if entry is None else entry[0]
+    
+    def check(self, models: Iterable[str], timeout: float = MODEL_PROBE_TIMEOUT) -> Dict[str, bool]:
+        """Get current availability of models, probing stale ones concurrently and waiting for them"""
+        models = list(models)
+        futures = self.refresh(models)
+        if futures:
+            wait(futures.values(), timeout=timeout)
+        
+        results = {}
+        with self._lock:
+            for model in models:
+                entry = self._status.get(model)
+                # Probes that missed the timeout count as unavailable for now
+                results[model] = entry[0] if entry is not None and model not in self._pending else False
+        return results
+    
+    def get_stats(self) -> dict:
+        """Get probe counts and the cached status of each model"""
+        with self._lock:
+            now = time.time()
+            return {
+                "probes": self.probes,
+                "pending": list(self._pending),
+                "models": {
+                    model: {"available": available, "age_seconds": now - checked_at}
+                    for model, (available, checked_at) in self._status.items()
+                }
+            }
+
+_shared_registry = None
+_shared_registry_lock = threading.Lock()
+
+def get_model_health(probe: Callable[[str], bool]) -> ModelHealthRegistry:
+    """Get the process-wide model health registry, created with probe on first use"""
+    global _shared_registry
+    with _shared_registry_lock:
+        if _shared_registry is None:
+            _shared_registry = ModelHealthRegistry(probe)
+        return _shared_registry
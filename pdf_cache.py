@@ -0,0 +1,147 @@
+import hashlib
+import os
+import pickle
+import re
+import threading
+import time
+import numpy as np
+from typing import Optional
+from config import PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES, PDF_CACHE_MAX_AGE_DAYS
+
+class PDFCache:
+    """On-disk cache of extracted text, chunks and embeddings keyed by SHA-256 of the PDF bytes"""
+    
+    def __init__(self, directory: str = PDF_CACHE_DIR, max_bytes: int = PDF_CACHE_MAX_BYTES,
+                 max_age_days: float = PDF_CACHE_MAX_AGE_DAYS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 24 * 3600
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+    
+    @staticmethod
+    def hash_bytes(data: bytes) -> str:
+        """Content address of an uploaded file"""
+        return hashlib.sha256(data).hexdigest()
+    
+    def _path(self, file_hash: str, suffix: str) -> str:
+        # Two-level fan-out keeps directories small
+        return os.path.join(self.directory, file_hash[:2], f"{file_hash}{suffix}")
+    
+    @staticmethod
+    def _model_suffix(model_name: str) -> str:
+        return "." + re.sub(r'[^A-Za-z0-9_.-]', '_', model_name) + ".npy"
+    
+    @staticmethod
+    def _write_atomic(path: str, write):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    
+    def load(self, file_hash: str, chunker: str, model_name: str = None) -> Optional[dict]:
+        """Get cached results for a file, or None if it was never processed with this chunker"""
+        entry_path = self._path(file_hash, ".pkl")
+        try:
+            with open(entry_path, "rb") as f:
+                entry = pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError):
+            self.misses += 1
+            return None
+        
+        if entry.get("chunker") != chunker:
+            self.misses += 1
+            return None
+        
+        # Entries only keep the pages; older ones still carry the joined text
+        if "text" not in entry:
+            entry["text"] = "\n".join(page_text for _, page_text in entry["pages"]).strip()
+        
+        entry["embeddings"] = None
+        if model_name:
+            try:
+                entry["embeddings"] = np.load(self._path(file_hash, self._model_suffix(model_name)))
+            except OSError:
+                pass
+        
+        # Touch hits so eviction drops the least recently used files
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+        
+        self.hits += 1
+        return entry
+    
+    def save(self, file_hash: str, entry: dict):
+        """Store pages, chunks and where each chunk starts (page, char offset) for a file and evict old files"""
+        data = {key: entry[key] for key in ("pages", "chunks", "chunker", "chunk_pages", "chunk_offsets")}
+        self._write_atomic(
+            self._path(file_hash, ".pkl"),
+            lambda f: pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        )
+        self._evict()
+    
+    def save_embeddings(self, file_hash: str, model_name: str, embeddings: np.ndarray):
+        """Store chunk embeddings for a file under the model that produced them"""
+        self._write_atomic(
+            self._path(file_hash, self._model_suffix(model_name)),
+            lambda f: np.save(f, np.asarray(embeddings, dtype='float32'))
+        )
+    
+    def _evict(self):
+        """Drop files unused for longer than max_age, then least recently used ones beyond max_bytes"""
+        with self._lock:
+            # A file's entry and its per-model embeddings go together
+            groups = {}
+            for root, _, names in os.walk(self.directory):
+                for name in names:
+                    if name.endswith(".tmp"):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    group = groups.setdefault(name.split(".", 1)[0], {"paths": [], "size": 0, "last_access": 0.0})
+                    group["paths"].append(path)
+                    group["size"] += stat.st_size
+                    group["last_access"] = max(group["last_access"], stat.st_mtime)
+            
+            total = sum(group["size"] for group in groups.values())
+            cutoff = time.time() - self.max_age
+            for group in sorted(groups.values(), key=lambda group: group["last_access"]):
+                if group["last_access"] >= cutoff and total <= self.max_bytes:
+                    break
+                for path in group["paths"]:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                total -= group["size"]
+                self.evictions += 1
+    
+    def get_stats(self) -> dict:
+        """Get hit/miss counters and size limits of the cache"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "max_bytes": self.max_bytes,
+            "max_age_days": self.max_age / (24 * 3600)
+        }
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+def get_pdf_cache() -> PDFCache:
+    """Get the process-wide PDF cache"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = PDFCache()
+        return _shared_cache
@@ -4,91 +4,348 @@ import pytesseract
 from pdf2image import convert_from_bytes
 from PIL import Image
 import re
-from typing import List
+from typing import Iterable, Iterator, List, Tuple
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
 import streamlit as st
 import io
+import logging
+import threading
+import time
+from config import (
+    PDF_EXTRACTION_WORKERS, PARALLEL_EXTRACTION_MIN_PAGES, OCR_WORKERS, OCR_PAGE_BATCH, OCR_DPI,
+    OCR_MIN_PAGE_CHARS, OCR_MIN_READABLE_RATIO, PDF_CACHE_ENABLED, INGEST_PAGE_RANGE,
+    EMBEDDING_MODEL, CHUNK_SIZE, CHUNK_OVERLAP
+)
+from pdf_cache import get_pdf_cache
+from embedding_models import get_tokenizer
+
+# Fallback token boundaries when the embedding model has no fast tokenizer
+_WORD_RE = re.compile(r'\w+|[^\w\s]')
+
+logger = logging.getLogger(__name__)
+
+# Process pool shared by all sessions, created on first use
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    """Get the shared process pool used for page extraction"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=PDF_EXTRACTION_WORKERS)
+        return _process_pool
+
+def _extract_page_range(pdf_bytes: bytes, start: int, end: int) -> List[Tuple[int, str]]:
+    """Extract text from pages [start, end) of a PDF, numbered from 1"""
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+    return [(page_num + 1, pdf_reader.pages[page_num].extract_text() or "") for page_num in range(start, end)]
+
+def _ocr_page(page_num: int, image) -> Tuple[int, str, float]:
+    """OCR one rasterized page; tesseract runs as its own process"""
+    start = time.perf_counter()
+    page_text = pytesseract.image_to_string(image, lang='eng')
+    return page_num, page_text, time.perf_counter() - start
+
+def _token_spans(tokenizer, text: str) -> List[Tuple[int, int]]:
+    """Character spans of the tokens in text, without special tokens"""
+    if tokenizer is not None and text:
+        try:
+            encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+            return [(start, end) for start, end in encoding["offset_mapping"] if end > start]
+        except Exception:
+            # Slow tokenizers cannot map tokens back to offsets
+            pass
+    return [match.span() for match in _WORD_RE.finditer(text)]
+
+def _page_batches(page_numbers: List[int], batch_size: int) -> List[List[int]]:
+    """Group sorted page numbers into consecutive runs of at most batch_size"""
+    batches = []
+    for page_num in page_numbers:
+        if batches and page_num == batches[-1][-1] + 1 and len(batches[-1]) < batch_size:
+            batches[-1].append(page_num)
+        else:
+            batches.append([page_num])
+    return batches
 
 class PDFProcessor:
+    # Bump when chunker output or the cached chunk fields change so cached chunks are rebuilt
+    CHUNKER_VERSION = "tokens-v2"
+    
     def __init__(self):
         self.text_chunks = []
+        self._tokenizer = None
+        self.ocr_timings = []
+        
+        # Extraction results are reused for byte-identical uploads
+        self.cache = None
+        if PDF_CACHE_ENABLED:
+            try:
+                self.cache = get_pdf_cache()
+            except Exception as e:
+                st.warning(f"PDF cache unavailable: {e}")
+    
+    def extract_pages_from_pdf(self, pdf_file) -> List[Tuple[int, str]]:
+        """Extract (page number, text) pairs, splitting large PDFs across processes"""
+        pdf_file.seek(0)
+        pdf_bytes = pdf_file.read()
+        page_count = len(PyPDF2.PdfReader(io.BytesIO(pdf_bytes)).pages)
+        
+        if page_count < PARALLEL_EXTRACTION_MIN_PAGES or PDF_EXTRACTION_WORKERS <= 1:
+            return _extract_page_range(pdf_bytes, 0, page_count)
+        
+        # A few ranges per worker keeps the pool busy when pages vary in cost
+        range_size = max(1, -(-page_count // (PDF_EXTRACTION_WORKERS * 4)))
+        pool = _get_process_pool()
+        futures = [
+            pool.submit(_extract_page_range, pdf_bytes, start, min(start + range_size, page_count))
+            for start in range(0, page_count, range_size)
+        ]
+        
+        pages = []
+        for future in futures:
+            pages.extend(future.result())
+        return pages
+    
+    @staticmethod
+    def needs_ocr(page_text: str) -> bool:
+        """Check whether a page's text layer is missing or unreadable"""
+        # Unmapped glyphs come out as "(cid:NN)" and carry no text
+        stripped = re.sub(r'\(cid:\d+\)', '', page_text).strip()
+        if len(stripped) < OCR_MIN_PAGE_CHARS:
+            return True
+        
+        # Broken font encodings show up as replacement characters or symbol soup
+        readable = sum(1 for char in stripped if char.isalnum() or char.isspace())
+        return readable / len(stripped) < OCR_MIN_READABLE_RATIO or stripped.count("\ufffd") > len(stripped) * 0.05
+    
+    def extract_pages(self, pdf_file) -> List[Tuple[int, str]]:
+        """Extract (page number, text) pairs, OCR-ing only pages without a usable text layer"""
+        pages = self.extract_pages_from_pdf(pdf_file)
+        scanned = [page_num for page_num, page_text in pages if self.needs_ocr(page_text)]
+        if not scanned:
+            return pages
+        
+        st.info(f"{len(scanned)} of {len(pages)} pages appear to be scanned. Using OCR...")
+        try:
+            ocr_pages = dict(self.extract_pages_with_ocr(pdf_file, scanned))
+        except Exception as e:
+            st.error(f"OCR extraction failed: {str(e)}")
+            return pages
+        
+        return [(page_num, ocr_pages.get(page_num, page_text)) for page_num, page_text in pages]
+    
+    def iter_pages(self, pdf_file) -> Iterator[Tuple[int, str]]:
+        """Yield (page number, text) in order a range of pages at a time, without touching the UI.
+
+        Scanned pages in a range are OCR-ed before the range is yielded, and
+        at most PDF_EXTRACTION_WORKERS ranges are extracted ahead of the consumer.
+        """
+        pdf_file.seek(0)
+        pdf_bytes = pdf_file.read()
+        page_count = len(PyPDF2.PdfReader(io.BytesIO(pdf_bytes)).pages)
+        ranges = [(start, min(start + INGEST_PAGE_RANGE, page_count)) for start in range(0, page_count, INGEST_PAGE_RANGE)]
+        
+        def with_ocr(pages):
+            scanned = [page_num for page_num, page_text in pages if self.needs_ocr(page_text)]
+            if not scanned:
+                return pages
+            try:
+                ocr_pages = dict(self.extract_pages_with_ocr(pdf_file, scanned, show_progress=False))
+            except Exception as e:
+                # Keep the text layer, as extract_pages does, rather than losing the whole file
+                logger.warning("OCR failed for pages %s of %s: %s", scanned, getattr(pdf_file, "name", "PDF"), e)
+                return pages
+            return [(page_num, ocr_pages.get(page_num, page_text)) for page_num, page_text in pages]
+        
+        if page_count < PARALLEL_EXTRACTION_MIN_PAGES or PDF_EXTRACTION_WORKERS <= 1:
+            for start, end in ranges:
+                yield from with_ocr(_extract_page_range(pdf_bytes, start, end))
+            return
+        
+        pool = _get_process_pool()
+        futures = deque()
+        for start, end in ranges:
+            futures.append(pool.submit(_extract_page_range, pdf_bytes, start, end))
+            if len(futures) >= PDF_EXTRACTION_WORKERS:
+                yield from with_ocr(futures.popleft().result())
+        while futures:
+            yield from with_ocr(futures.popleft().result())
     
     def extract_text_from_pdf(self, pdf_file) -> str:
         """Extract text from PDF file"""
         try:
-            # Reset file pointer
-            pdf_file.seek(0)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            text = ""
-            
-            for page_num, page in enumerate(pdf_reader.pages):
-                page_text = page.extract_text()
-                text += page_text + "\n"
-            
-            # If text is mostly empty, try OCR
-            if len(text.strip()) < 100:
-                st.info("PDF appears to be scanned. Using OCR...")
-                text = self.extract_text_with_ocr(pdf_file)
-            
-            return text.strip()
+            pages = self.extract_pages(pdf_file)
+            return "\n".join(page_text for _, page_text in pages).strip()
         except Exception as e:
             st.error(f"Error extracting text: {str(e)}")
             return ""
     
-    def extract_text_with_ocr(self, pdf_file) -> str:
-        """Extract text using OCR for scanned PDFs"""
-        try:
-            pdf_file.seek(0)
-            # Convert PDF to images
-            images = convert_from_bytes(pdf_file.read(), dpi=200)
-            text = ""
-            
+    def extract_pages_with_ocr(self, pdf_file, page_numbers: List[int] = None, show_progress: bool = True) -> List[Tuple[int, str]]:
+        """OCR pages, rasterizing a few at a time and fanning them out to tesseract workers"""
+        pdf_file.seek(0)
+        pdf_bytes = pdf_file.read()
+        if page_numbers is None:
+            page_numbers = range(1, len(PyPDF2.PdfReader(io.BytesIO(pdf_bytes)).pages) + 1)
+        page_numbers = sorted(page_numbers)
+        if not page_numbers:
+            return []
+        
+        pages = {}
+        self.ocr_timings = []
+        if show_progress:
             progress_bar = st.progress(0)
-            for i, image in enumerate(images):
-                # Update progress
-                progress_bar.progress((i + 1) / len(images))
+            status = st.empty()
+        
+        def collect(finished):
+            for future in finished:
+                page_num, page_text, seconds = future.result()
+                pages[page_num] = page_text
+                self.ocr_timings.append({"page": page_num, "seconds": seconds})
+            if show_progress:
+                progress_bar.progress(len(pages) / len(page_numbers))
+                status.caption(f"OCR: {len(pages)}/{len(page_numbers)} pages")
+        
+        with ThreadPoolExecutor(max_workers=OCR_WORKERS) as executor:
+            pending = set()
+            for batch in _page_batches(page_numbers, OCR_PAGE_BATCH):
+                # Backpressure: only rasterize more pages once workers free up,
+                # so at most a few page images are held in memory at a time
+                while len(pending) >= OCR_WORKERS:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(finished)
                 
-                # Extract text from each page image
-                page_text = pytesseract.image_to_string(image, lang='eng')
-                text += page_text + "\n"
+                images = convert_from_bytes(pdf_bytes, dpi=OCR_DPI, first_page=batch[0], last_page=batch[-1])
+                for page_num, image in zip(batch, images):
+                    pending.add(executor.submit(_ocr_page, page_num, image))
+                del images
             
+            while pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+        
+        if show_progress:
             progress_bar.empty()
-            return text.strip()
+            status.empty()
+        return sorted(pages.items())
+    
+    def extract_text_with_ocr(self, pdf_file) -> str:
+        """Extract text using OCR for scanned PDFs"""
+        try:
+            pages = self.extract_pages_with_ocr(pdf_file)
+            return "\n".join(page_text for _, page_text in pages).strip()
         except Exception as e:
             st.error(f"OCR extraction failed: {str(e)}")
             return ""
     
-    def chunk_text(self, text: str, chunk_size: int = 500) -> List[str]:
-        """Split text into chunks for better processing"""
-        # Clean text
-        text = re.sub(r'\s+', ' ', text)
-        text = text.strip()
+    def _get_tokenizer(self):
+        """The embedding model's tokenizer and its per-input token limit, loaded on first use"""
+        if self._tokenizer is None:
+            self._tokenizer = get_tokenizer(EMBEDDING_MODEL)
+        return self._tokenizer
+    
+    @property
+    def chunker_id(self) -> str:
+        """Identifies chunker output; token counts depend on the embedding model's tokenizer"""
+        return f"{self.CHUNKER_VERSION}:{self._get_tokenizer()[2]}"
+    
+    def iter_chunk_spans(self, pages: Iterable[Tuple[int, str]], chunk_size: int = CHUNK_SIZE,
+                         overlap: int = CHUNK_OVERLAP) -> Iterator[dict]:
+        """Chunk a stream of (page number, text) pairs by tokens of the embedding model.
         
-        if not text:
-            return []
+        Sentences are packed whole into chunks of at most chunk_size tokens, capped
+        at the model's input window; a longer sentence is split at token boundaries.
+        Each chunk after the first starts with the trailing sentences of the previous
+        one that fit in overlap tokens. Every page is tokenized once, so the cost is
+        linear in the text. Chunks are dicts with the original text (whitespace
+        collapsed), its token count, and where it starts and ends: "page"/"char_start"
+        and "end_page"/"char_end", as character offsets into those pages' text.
+        """
+        tokenizer, max_input_tokens, _ = self._get_tokenizer()
+        max_tokens = max(1, min(chunk_size, max_input_tokens))
+        overlap = min(overlap, max_tokens // 2)
+        
+        # Text of the pages seen so far, joined by newlines, from global offset `base` on
+        buffer = ""
+        base = 0
+        page_starts = []
+        page_numbers = []
+        
+        units = deque()  # (start, end, tokens) sentences of the chunk being filled
+        unit_tokens = 0
         
-        # Split by sentences first
-        sentences = re.split(r'[.!?]+', text)
-        chunks = []
-        current_chunk = ""
+        def locate(position: int) -> Tuple[int, int]:
+            index = bisect_right(page_starts, position) - 1
+            return page_numbers[index], position - page_starts[index]
         
-        for sentence in sentences:
-            sentence = sentence.strip()
-            if not sentence:
-                continue
+        def emit() -> dict:
+            start, end = units[0][0], units[-1][1]
+            page, char_start = locate(start)
+            end_page, char_end = locate(end)
+            return {
+                "text": re.sub(r'\s+', ' ', buffer[start - base:end - base]).strip(),
+                "tokens": unit_tokens,
+                "page": page,
+                "char_start": char_start,
+                "end_page": end_page,
+                "char_end": char_end
+            }
+        
+        def add(unit: Tuple[int, int, int]) -> Iterator[dict]:
+            nonlocal unit_tokens
+            if units and unit_tokens + unit[2] > max_tokens:
+                yield emit()
+                # Keep the overlap, and only as much of it as leaves room for this sentence
+                while units and (unit_tokens > overlap or unit_tokens + unit[2] > max_tokens):
+                    unit_tokens -= units.popleft()[2]
+            units.append(unit)
+            unit_tokens += unit[2]
+        
+        sentence = None  # [start, end, tokens]; may continue on the next page
+        for page_number, page_text in pages:
+            page_start = base + len(buffer) + (1 if page_starts else 0)
+            buffer = f"{buffer}\n{page_text}" if page_starts else page_text
+            page_starts.append(page_start)
+            page_numbers.append(page_number)
+            
+            for token_start, token_end in _token_spans(tokenizer, page_text):
+                if sentence is None:
+                    sentence = [page_start + token_start, 0, 0]
+                sentence[1] = page_start + token_end
+                sentence[2] += 1
                 
-            # Check if adding this sentence would exceed chunk size
-            if len(current_chunk + sentence) < chunk_size:
-                current_chunk += sentence + ". "
-            else:
-                if current_chunk.strip():
-                    chunks.append(current_chunk.strip())
-                current_chunk = sentence + ". "
-        
-        # Add the last chunk
-        if current_chunk.strip():
-            chunks.append(current_chunk.strip())
-        
-        return chunks
+                ends_sentence = (page_text[token_end - 1] in ".!?" and
+                                 (token_end == len(page_text) or page_text[token_end].isspace()))
+                if ends_sentence or sentence[2] >= max_tokens:
+                    yield from add(tuple(sentence))
+                    sentence = None
+            
+            # Drop text no chunk can reach any more; halving keeps the copying linear
+            keep = min(
+                units[0][0] if units else page_start + len(page_text),
+                sentence[0] if sentence else page_start + len(page_text)
+            )
+            if keep - base > len(buffer) // 2:
+                buffer = buffer[keep - base:]
+                base = keep
+        
+        if sentence is not None:
+            yield from add(tuple(sentence))
+        if units:
+            # Whatever follows the last emitted chunk's overlap
+            yield emit()
+    
+    def chunk_text(self, text: str, chunk_size: int = CHUNK_SIZE) -> List[str]:
+        """Split text into chunks of at most chunk_size embedding tokens"""
+        return [chunk["text"] for chunk in self.iter_chunk_spans([(1, text)], chunk_size)]
+    
+    def iter_chunks(self, page_texts: Iterable[str], chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+        """Chunk a stream of page texts, emitting chunks as soon as their sentences are complete"""
+        pages = enumerate(page_texts, 1)
+        for chunk in self.iter_chunk_spans(pages, chunk_size):
+            yield chunk["text"]
     
     def get_text_preview(self, text: str, max_length: int = 200) -> str:
         """Get a preview of the extracted text"""
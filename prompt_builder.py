@@ -0,0 +1,65 @@
+from functools import lru_cache
+from typing import List, Dict, Tuple
+from context_builder import build_context
+from config import PROMPT_CACHE_SIZE
+
+SYSTEM_PROMPT = """You are a helpful AI assistant that answers questions based on provided context from PDF documents and web sources.
+
+Instructions:
+1. Use the provided context to answer the question accurately
+2. If information comes from PDFs, mention "According to the PDF documents..."
+3. If information comes from web sources, mention "According to web sources..."
+4. If you use both sources, clearly distinguish between them
+5. If the context doesn't contain enough information, say so and provide what you can
+6. Be concise but comprehensive
+7. Always cite your sources when possible
+8. Format your response clearly with proper sections if needed"""
+
+CONTEXT_INSTRUCTION = "Please provide a comprehensive answer based on the available context."
+NO_CONTEXT_INSTRUCTION = (
+    "Please provide a helpful answer to this question. Since no specific context is provided, "
+    "use your general knowledge but mention that the answer is based on general knowledge."
+)
+
+def _source_keys(pdf_context: List = None, web_context: List[Dict] = None) -> Tuple[tuple, tuple]:
+    """Hashable identity of the sources a prompt is built from"""
+    pdf_key = tuple(pdf_context or ())
+    web_key = tuple(
+        (result.get('title', ''), result.get('snippet', ''), result.get('url', '')) for result in web_context or ()
+    )
+    return pdf_key, web_key
+
+@lru_cache(maxsize=PROMPT_CACHE_SIZE)
+def _build_prompt(question: str, pdf_key: tuple, web_key: tuple, model: str, budget: int) -> Tuple[str, tuple]:
+    web_context = [{"title": title, "snippet": snippet, "url": url} for title, snippet, url in web_key]
+    context, stats = build_context(list(pdf_key), web_context, model, budget)
+    
+    if context:
+        user_prompt = "".join(("Context Information:\n", context, "\n\nQuestion: ", question, "\n\n", CONTEXT_INSTRUCTION))
+    else:
+        user_prompt = "".join(("Question: ", question, "\n\n", NO_CONTEXT_INSTRUCTION))
+    return user_prompt, tuple(stats.items())
+
+def build_messages(question: str, pdf_context: List = None, web_context: List[Dict] = None,
+                   model: str = "", budget: int = None) -> Tuple[List[Dict], Dict]:
+    """Build the chat messages for a question and its sources.
+
+    Prompts are memoized per (question, sources, model, budget), so the same
+    question asked in both answer modes or on a rerun is assembled once.
+    Returns the messages and the context stats from build_context.
+    """
+    pdf_key, web_key = _source_keys(pdf_context, web_context)
+    user_prompt, stats = _build_prompt(question, pdf_key, web_key, model, budget)
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+    return messages, dict(stats)
+
+def build_summary_messages(text: str, max_length: int) -> List[Dict]:
+    """Build the chat messages asking for a summary of text"""
+    prompt = "".join((
+        "Please summarize the following text in about ", str(max_length),
+        " characters while keeping the key information:\n\n", text, "\n\nSummary:"
+    ))
+    return [{"role": "user", "content": prompt}]
@@ -0,0 +1,236 @@
+import asyncio
+import random
+import re
+import threading
+import time
+from typing import Awaitable, Callable, List, Optional, Tuple, TypeVar
+import groq
+from config import (
+    MODEL_FALLBACK_CHAIN, API_MAX_RETRIES, RETRY_BASE_DELAY, RETRY_MAX_DELAY,
+    CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT
+)
+
+T = TypeVar("T")
+
+_DURATION_RE = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+class CircuitOpenError(Exception):
+    """Raised when every candidate model is failing and its circuit is open"""
+
+class CircuitBreaker:
+    """Stops calls to a model after repeated failures, letting one trial call through after a cool-down"""
+    
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_timeout: float = CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_started_at = 0.0
+        self._lock = threading.Lock()
+    
+    def allow(self) -> bool:
+        """Whether a call may go out now"""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            now = time.time()
+            if self.state == "open" and now - self.opened_at >= self.reset_timeout:
+                # This caller becomes the single trial; others wait for its outcome
+                self.state = "half_open"
+                self.trial_started_at = now
+                return True
+            if self.state == "half_open" and now - self.trial_started_at >= self.reset_timeout:
+                # The trial never reported back, e.g. it was cancelled; let another one through
+                self.trial_started_at = now
+                return True
+            return False
+    
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.time()
+    
+    def trip(self):
+        """Open the circuit immediately, e.g. when the model does not exist"""
+        with self._lock:
+            self.failures = max(self.failures, self.failure_threshold)
+            self.state = "open"
+            self.opened_at = time.time()
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(model: str) -> CircuitBreaker:
+    """Get the process-wide circuit breaker for a model"""
+    with _breakers_lock:
+        breaker = _breakers.get(model)
+        if breaker is None:
+            breaker = _breakers[model] = CircuitBreaker()
+        return breaker
+
+def get_circuit_states() -> dict:
+    """Get the state of every model's circuit"""
+    with _breakers_lock:
+        return {model: breaker.state for model, breaker in _breakers.items()}
+
+def _status_code(error: Exception) -> Optional[int]:
+    return getattr(error, "status_code", None)
+
+def is_model_error(error: Exception) -> bool:
+    """Whether the model itself is missing or decommissioned, so retrying it cannot help"""
+    message = str(error).lower()
+    status = _status_code(error)
+    return status == 404 or (status == 400 and "model" in message and
+                             ("not found" in message or "decommissioned" in message or "does not exist" in message))
+
+def is_retryable(error: Exception) -> bool:
+    """Whether an error is transient: rate limits, server errors, timeouts and dropped connections"""
+    status = _status_code(error)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    return isinstance(error, (groq.APIConnectionError, ConnectionError, TimeoutError))
+
+def _parse_duration(value: str) -> Optional[float]:
+    """Parse a retry-after value: plain seconds or a duration like "1m2.5s" / "120ms" """
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds the API asked us to wait, from the headers of the error response.
+
+    retry-after-ms and retry-after are wait instructions. The x-ratelimit-reset-*
+    headers come on every response and only say when a quota refills, so they
+    are used for a 429 alone, and only for the limit that was actually used up.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    
+    if headers.get("retry-after-ms"):
+        delay = _parse_duration(headers["retry-after-ms"])
+        return delay / 1000 if delay is not None else None
+    if headers.get("retry-after"):
+        return _parse_duration(headers["retry-after"])
+    
+    if _status_code(error) != 429:
+        return None
+    for limit in ("tokens", "requests"):
+        if headers.get(f"x-ratelimit-remaining-{limit}", "").strip() == "0" and headers.get(f"x-ratelimit-reset-{limit}"):
+            return _parse_duration(headers[f"x-ratelimit-reset-{limit}"])
+    return None
+
+def backoff_delay(attempt: int, base_delay: float = RETRY_BASE_DELAY, max_delay: float = RETRY_MAX_DELAY) -> float:
+    """Exponential backoff with full jitter, so retrying clients spread out instead of stampeding"""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+def _on_failure(error: Exception, candidate: str, breaker: CircuitBreaker, attempt: int,
+                max_retries: int, health) -> Optional[float]:
+    """Book-keep a failed call; returns seconds to wait before retrying, or None to move to the next model"""
+    if is_model_error(error):
+        breaker.trip()
+        if health is not None:
+            health.record(candidate, False)
+        return None
+    if not is_retryable(error):
+        # The API answered, so the model is healthy; the request itself is at fault
+        breaker.record_success()
+        raise error
+    
+    breaker.record_failure()
+    delay = retry_after(error)
+    if delay is None:
+        delay = backoff_delay(attempt)
+    elif delay > RETRY_MAX_DELAY:
+        return None
+    return delay if attempt < max_retries else None
+
+def _on_success(candidate: str, breaker: CircuitBreaker, health):
+    breaker.record_success()
+    if health is not None:
+        health.record(candidate, True)
+
+def _candidates(model: str, fallback_chain: List[str]) -> List[str]:
+    return [model] + [fallback for fallback in fallback_chain if fallback != model]
+
+def _all_failed(candidates: List[str], last_error: Optional[Exception]) -> Exception:
+    if last_error is None:
+        return CircuitOpenError(f"All models are temporarily unavailable: {', '.join(candidates)}")
+    return last_error
+
+def call_with_fallback(call: Callable[[str], T], model: str, fallback_chain: List[str] = MODEL_FALLBACK_CHAIN,
+                       max_retries: int = API_MAX_RETRIES, health=None) -> Tuple[T, str]:
+    """Call call(model), retrying transient errors and falling back along the model chain.
+
+    Models whose circuit is open are skipped. A rate limit asking for a longer
+    wait than RETRY_MAX_DELAY moves on to the next model instead of sleeping.
+    Errors that are neither transient nor about the model are raised at once.
+    Returns the result and the model that produced it; health, if given, is
+    told which models answered or turned out to be missing.
+    """
+    candidates = _candidates(model, fallback_chain)
+    last_error = None
+    
+    for candidate in candidates:
+        breaker = get_circuit_breaker(candidate)
+        for attempt in range(max_retries + 1):
+            if not breaker.allow():
+                break
+            
+            try:
+                result = call(candidate)
+            except Exception as e:
+                last_error = e
+                delay = _on_failure(e, candidate, breaker, attempt, max_retries, health)
+                if delay is None:
+                    break
+                time.sleep(delay)
+                continue
+            
+            _on_success(candidate, breaker, health)
+            return result, candidate
+    
+    raise _all_failed(candidates, last_error)
+
+async def acall_with_fallback(call: Callable[[str], Awaitable[T]], model: str,
+                              fallback_chain: List[str] = MODEL_FALLBACK_CHAIN,
+                              max_retries: int = API_MAX_RETRIES, health=None) -> Tuple[T, str]:
+    """Async counterpart of call_with_fallback; backoff waits do not block the event loop"""
+    candidates = _candidates(model, fallback_chain)
+    last_error = None
+    
+    for candidate in candidates:
+        breaker = get_circuit_breaker(candidate)
+        for attempt in range(max_retries + 1):
+            if not breaker.allow():
+                break
+            
+            try:
+                result = await call(candidate)
+            except Exception as e:
+                last_error = e
+                delay = _on_failure(e, candidate, breaker, attempt, max_retries, health)
+                if delay is None:
+                    break
+                await asyncio.sleep(delay)
+                continue
+            
+            _on_success(candidate, breaker, health)
+            return result, candidate
+    
+    raise _all_failed(candidates, last_error)
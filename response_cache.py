@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Optional
+from config import RESPONSE_CACHE_PATH, RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_ENTRIES
+
+class ResponseCache:
+    """SQLite cache of LLM responses keyed by a fingerprint of the exact request"""
+    
+    def __init__(self, path: str = RESPONSE_CACHE_PATH, ttl_seconds: float = RESPONSE_CACHE_TTL,
+                 max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_access ON responses (last_access)")
+        self._conn.commit()
+    
+    @staticmethod
+    def make_key(model: str, temperature: float, max_tokens: int, messages: List[Dict]) -> str:
+        """Fingerprint everything that determines a completion"""
+        payload = json.dumps(
+            {"model": model, "temperature": temperature, "max_tokens": max_tokens, "messages": messages},
+            sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        """Get a live response, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+    
+    def set(self, key: str, response: str):
+        """Store a response and trim expired and least recently used entries"""
+        if not response:
+            return
+        
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, response, now + self.ttl_seconds, now)
+            )
+            self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+    
+    def clear(self):
+        """Remove every cached response"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+    
+    def get_stats(self) -> dict:
+        """Get hit/miss counters and size of the cache"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds
+        }
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+def get_response_cache() -> ResponseCache:
+    """Get the process-wide response cache"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache()
+        return _shared_cache
@@ -0,0 +1,71 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict
+import streamlit as st
+from config import PDF_SEARCH_TIMEOUT, WEB_SEARCH_TIMEOUT, RETRIEVAL_WORKERS, SIMILARITY_THRESHOLD
+
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:
+    add_script_run_ctx = get_script_run_ctx = None
+
+# Worker threads shared by all sessions; searches are I/O bound or release the GIL
+_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+
+def _run_timed(ctx, func, *args, **kwargs):
+    """Run a search in a worker thread and measure how long it took"""
+    if ctx is not None:
+        # Lets st.warning/st.error from the search reach the caller's page
+        add_script_run_ctx(threading.current_thread(), ctx)
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def retrieve_sources(question: str, vector_store, web_searcher, search_pdf: bool = True, search_web: bool = True,
+                     pdf_k: int = 3, web_max: int = 3, threshold: float = SIMILARITY_THRESHOLD,
+                     search_mode: str = None, pdf_timeout: float = PDF_SEARCH_TIMEOUT,
+                     web_timeout: float = WEB_SEARCH_TIMEOUT) -> Dict:
+    """Search PDFs and the web concurrently, keeping whatever finishes before its deadline.
+
+    Returns a dict with "pdf" (texts), "pdf_sources" (file/page metadata of each
+    PDF text), "web" (result dicts), "latency" (seconds per source) and
+    "timed_out" (sources that missed their deadline).
+    """
+    ctx = get_script_run_ctx() if get_script_run_ctx else None
+    start = time.perf_counter()
+    
+    futures = {}
+    deadlines = {}
+    if search_pdf:
+        futures["pdf"] = _executor.submit(_run_timed, ctx, vector_store.search, question, k=pdf_k,
+                                       search_mode=search_mode, with_metadata=True)
+        deadlines["pdf"] = start + pdf_timeout
+    if search_web:
+        futures["web"] = _executor.submit(_run_timed, ctx, web_searcher.search_multiple_sources, question, max_results=web_max)
+        deadlines["web"] = start + web_timeout
+    
+    retrieval = {"pdf": [], "pdf_sources": [], "web": [], "latency": {}, "timed_out": []}
+    for source, future in futures.items():
+        try:
+            result, seconds = future.result(timeout=max(0.0, deadlines[source] - time.perf_counter()))
+        except FutureTimeoutError:
+            # The search keeps running in the background; its result is dropped
+            retrieval["timed_out"].append(source)
+            retrieval["latency"][source] = time.perf_counter() - start
+            continue
+        except Exception as e:
+            st.warning(f"{source.upper()} search failed: {e}")
+            retrieval["latency"][source] = time.perf_counter() - start
+            continue
+        
+        retrieval["latency"][source] = seconds
+        if source == "pdf":
+            kept = [(text, metadata) for text, score, metadata in result if score > threshold]
+            retrieval["pdf"] = [text for text, _ in kept]
+            retrieval["pdf_sources"] = [metadata for _, metadata in kept]
+        else:
+            retrieval["web"] = result
+    
+    retrieval["latency"]["total"] = time.perf_counter() - start
+    return retrieval
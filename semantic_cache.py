@@ -0,0 +1,112 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional
+import faiss
+import numpy as np
+from embedding_models import get_embedding_model
+from config import EMBEDDING_MODEL, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES
+
+# Neighbours checked per lookup, since close questions may have other contexts
+SEMANTIC_CACHE_CANDIDATES = 8
+
+class SemanticAnswerCache:
+    """Previous answers found again by question similarity under the same context"""
+    
+    def __init__(self, model_name: str = EMBEDDING_MODEL, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES):
+        self.model, self.model_name = get_embedding_model(model_name)
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.index = None
+        self.entries = OrderedDict()  # id -> entry, oldest first
+        self._next_id = 0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def context_fingerprint(model: str, pdf_context: List[str] = None, web_context: List[Dict] = None) -> str:
+        """Hash the model and the sources an answer was generated from"""
+        digest = hashlib.sha256(model.encode("utf-8"))
+        for text in pdf_context or []:
+            digest.update(b"\x00pdf\x00" + text.encode("utf-8"))
+        for result in web_context or []:
+            digest.update(b"\x00web\x00" + f"{result.get('url', '')}\x00{result.get('snippet', '')}".encode("utf-8"))
+        return digest.hexdigest()
+    
+    def _embed(self, question: str) -> np.ndarray:
+        embedding = np.ascontiguousarray(self.model.encode([question], show_progress_bar=False), dtype='float32')
+        faiss.normalize_L2(embedding)
+        return embedding
+    
+    def lookup(self, question: str, fingerprint: str) -> Optional[str]:
+        """Get a cached answer for a paraphrase of question with the same context"""
+        with self._lock:
+            if self.index is None or not self.entries:
+                self.misses += 1
+                return None
+        
+        embedding = self._embed(question)
+        
+        with self._lock:
+            scores, ids = self.index.search(embedding, min(SEMANTIC_CACHE_CANDIDATES, len(self.entries)))
+            for score, entry_id in zip(scores[0], ids[0]):
+                if score < self.threshold:
+                    break
+                entry = self.entries.get(int(entry_id))
+                if entry is not None and entry["fingerprint"] == fingerprint:
+                    self.hits += 1
+                    return entry["answer"]
+            
+            self.misses += 1
+            return None
+    
+    def store(self, question: str, fingerprint: str, answer: str):
+        """Remember an answer for later paraphrases"""
+        if not answer:
+            return
+        
+        embedding = self._embed(question)
+        
+        with self._lock:
+            if self.index is None:
+                self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(embedding.shape[1]))
+            
+            entry_id = self._next_id
+            self._next_id += 1
+            self.index.add_with_ids(embedding, np.array([entry_id], dtype='int64'))
+            self.entries[entry_id] = {"question": question, "fingerprint": fingerprint, "answer": answer}
+            
+            # Drop the oldest answers beyond max_entries
+            while len(self.entries) > self.max_entries:
+                old_id, _ = self.entries.popitem(last=False)
+                self.index.remove_ids(np.array([old_id], dtype='int64'))
+    
+    def clear(self):
+        """Forget every cached answer"""
+        with self._lock:
+            self.index = None
+            self.entries.clear()
+    
+    def get_stats(self) -> dict:
+        """Get hit/miss counters and size of the cache"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+            "threshold": self.threshold
+        }
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+def get_semantic_cache() -> SemanticAnswerCache:
+    """Get the process-wide semantic answer cache"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = SemanticAnswerCache()
+        return _shared_cache
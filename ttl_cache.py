@@ -0,0 +1,103 @@
+import atexit
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after ttl_seconds, optionally saved to disk"""
+    
+    def __init__(self, max_entries: int, ttl_seconds: float, persist_path: str = None, persist_interval: float = 30.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+        self.persist_interval = persist_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value), least recently used first
+        self._lock = threading.Lock()
+        self._last_saved = time.time()
+        
+        if persist_path:
+            self._load()
+            atexit.register(self.save)
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Get a live value, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+    
+    def set(self, key: Hashable, value: Any):
+        """Store a value, evicting the least recently used entries if full"""
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            
+            should_save = self.persist_path and time.time() - self._last_saved >= self.persist_interval
+        
+        if should_save:
+            self.save()
+    
+    def clear(self):
+        """Remove every entry"""
+        with self._lock:
+            self._entries.clear()
+    
+    def save(self):
+        """Write live entries to persist_path"""
+        if not self.persist_path:
+            return
+        
+        with self._lock:
+            now = time.time()
+            live = [(key, entry) for key, entry in self._entries.items() if entry[0] >= now]
+            self._last_saved = now
+        
+        directory = os.path.dirname(self.persist_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.persist_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(live, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.persist_path)
+    
+    def _load(self):
+        """Read entries saved by a previous process, dropping expired ones"""
+        try:
+            with open(self.persist_path, "rb") as f:
+                saved = pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError):
+            return
+        
+        now = time.time()
+        for key, entry in saved[-self.max_entries:]:
+            if entry[0] >= now:
+                self._entries[key] = entry
+    
+    def get_stats(self) -> dict:
+        """Get hit/miss counters and size of the cache"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds
+        }
@@ -1,99 +1,795 @@
-
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from typing import List, Tuple
+from typing import Dict, List, Tuple
+from collections import deque
+import os
 import pickle
+import shutil
+import threading
+import time
+import uuid
 import streamlit as st
-from config import EMBEDDING_MODEL, SIMILARITY_THRESHOLD
+from numpy.lib.format import open_memmap
+from config import (
+    EMBEDDING_MODEL, SIMILARITY_THRESHOLD, VECTOR_BUFFER_INITIAL_CAPACITY, INGEST_TIMINGS_HISTORY,
+    EMBEDDING_CACHE_ENABLED, INDEX_TYPE, ANN_TRAIN_THRESHOLD, ANN_RETRAIN_FACTOR,
+    ANN_MAX_TRAINING_POINTS, HNSW_M, TOMBSTONE_COMPACT_RATIO, PQ_SUBQUANTIZERS, DEFAULT_SEARCH_MODE, SEARCH_MODE_PARAMS,
+    VECTOR_STORE_DIR, VECTOR_STORE_GENERATIONS_KEPT
+)
+from embedding_cache import get_embedding_cache
+from embedding_models import get_embedding_model
+
+INDEX_FILE = "index.faiss"
+EMBEDDINGS_FILE = "embeddings.npy"
+STORE_FILE = "store.pkl"
+METADATA_FILE = "metadata.npz"
+TEXTS_FILE = "texts.npy"  # UTF-8 bytes of all chunk texts, back to back
+TEXT_OFFSETS_FILE = "text_offsets.npy"  # Row i's text is TEXTS_FILE[offsets[i]:offsets[i + 1]]
+CURRENT_FILE = "CURRENT"  # Names the generation directory loaders should read
+GENERATION_PREFIX = "gen-"
+
+# Per-chunk metadata, one column per field, row-aligned with the embeddings
+# and FAISS ids; -1 marks values that are unknown
+METADATA_COLUMNS = {"file_id": "int32", "page": "int32", "char_offset": "int32", "ingested_at": "float64"}
+
+# file_id of rows whose document was removed; they stay in the buffer so ids never shift
+TOMBSTONE = -2
+
+IVF_INDEX_TYPES = ("ivf_flat", "ivf_pq")
+
+def _grown(array: np.ndarray, capacity: int, rows: int) -> np.ndarray:
+    """Copy the first rows of array into a new array with room for capacity rows"""
+    new_array = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+    new_array[:rows] = array[:rows]
+    return new_array
+
+class TextColumn:
+    """Chunk texts by row: saved rows are sliced from a memory-mapped UTF-8 blob, rows added since load live in a list.
+
+    Removed rows read as None; they are saved as empty slices, which live
+    rows never are, since empty texts are not indexed.
+    """
+    
+    def __init__(self, texts: List[str] = None, blob: np.ndarray = None, offsets: np.ndarray = None):
+        self._blob = blob if blob is not None else np.empty(0, dtype=np.uint8)
+        self._offsets = offsets if offsets is not None else np.zeros(1, dtype=np.int64)
+        self._saved = len(self._offsets) - 1
+        self._added = list(texts or [])
+        self._removed = set()  # saved rows removed since load
+    
+    def __len__(self) -> int:
+        return self._saved + len(self._added)
+    
+    def __getitem__(self, row: int):
+        if row >= self._saved:
+            return self._added[row - self._saved]
+        start, end = self._offsets[row], self._offsets[row + 1]
+        if start == end or row in self._removed:
+            return None
+        return bytes(self._blob[start:end]).decode("utf-8")
+    
+    def __setitem__(self, row: int, value):
+        # Rows are only ever removed in place; new texts are appended with extend
+        if value is not None:
+            raise ValueError("Texts can only be removed in place")
+        if row >= self._saved:
+            self._added[row - self._saved] = None
+        else:
+            self._removed.add(row)
+    
+    def extend(self, texts: List[str]):
+        self._added.extend(texts)
+    
+    def take(self, rows: np.ndarray) -> "TextColumn":
+        """New column holding only the given rows (ascending), copying saved texts in contiguous runs"""
+        rows = np.asarray(rows, dtype=np.int64)
+        saved_rows = rows[rows < self._saved]
+        lengths = self._offsets[saved_rows + 1] - self._offsets[saved_rows]
+        offsets = np.zeros(len(saved_rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        
+        blob = np.empty(int(offsets[-1]), dtype=np.uint8)
+        position = 0
+        for run in np.split(saved_rows, np.flatnonzero(np.diff(saved_rows) != 1) + 1):
+            if len(run):
+                data = self._blob[self._offsets[run[0]]:self._offsets[run[-1] + 1]]
+                blob[position:position + len(data)] = data
+                position += len(data)
+        
+        added = [self._added[row - self._saved] for row in rows[rows >= self._saved]]
+        return TextColumn(added, blob=blob, offsets=offsets)
+    
+    def save(self, blob_path: str, offsets_path: str):
+        """Write the blob and offsets files, copying saved rows from the old blob in runs"""
+        added = [text.encode("utf-8") if text is not None else b"" for text in self._added]
+        lengths = np.concatenate([np.diff(self._offsets), np.array([len(data) for data in added], dtype=np.int64)])
+        removed = sorted(self._removed)
+        lengths[removed] = 0
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        
+        blob = open_memmap(blob_path, mode="w+", dtype=np.uint8, shape=(int(offsets[-1]),))
+        start = 0
+        for end in removed + [self._saved]:
+            blob[offsets[start]:offsets[end]] = self._blob[self._offsets[start]:self._offsets[end]]
+            start = end + 1
+        if added:
+            blob[offsets[self._saved]:] = np.frombuffer(b"".join(added), dtype=np.uint8)
+        blob.flush()
+        del blob
+        np.save(offsets_path, offsets)
+    
+    @classmethod
+    def load(cls, blob_path: str, offsets_path: str) -> "TextColumn":
+        """Memory-map saved texts; nothing is decoded until a row is read"""
+        return cls(blob=np.load(blob_path, mmap_mode="r"), offsets=np.load(offsets_path, mmap_mode="r"))
+
+def create_index(index_type: str, dimension: int, n_vectors: int = 0) -> faiss.Index:
+    """Create an empty inner-product index of the given type, addressed by caller-chosen ids"""
+    if index_type == "flat":
+        return faiss.index_factory(dimension, "IDMap2,Flat", faiss.METRIC_INNER_PRODUCT)
+    
+    # ~4*sqrt(n) lists, with at least 39 training points per list
+    nlist = max(1, min(int(4 * np.sqrt(n_vectors)), n_vectors // 39))
+    
+    if index_type == "ivf_flat":
+        description = f"IVF{nlist},Flat"
+    elif index_type == "hnsw":
+        description = f"IDMap2,HNSW{HNSW_M}"
+    elif index_type == "ivf_pq":
+        # Sub-quantizer count must divide the dimension
+        m = max(d for d in range(1, PQ_SUBQUANTIZERS + 1) if dimension % d == 0)
+        description = f"IVF{nlist},PQ{m}"
+    else:
+        raise ValueError(f"Unknown index type: {index_type}")
+    
+    return faiss.index_factory(dimension, description, faiss.METRIC_INNER_PRODUCT)
 
 class VectorStore:
     def __init__(self, model_name: str = EMBEDDING_MODEL):
-        try:
-            self.model = SentenceTransformer(model_name)
-        except Exception as e:
-            st.error(f"Error loading embedding model: {e}")
-            # Fallback to a smaller model
-            self.model = SentenceTransformer('all-MiniLM-L6-v2')
+        # The model is shared process-wide; only the index is per session
+        self.model, self.model_name = get_embedding_model(model_name)
         
         self.index = None
-        self.texts = []
-        self.embeddings = None
+        self.index_type = "flat"
+        self.trained_size = 0
+        self.texts = TextColumn()
         self.dimension = None
+        
+        # Source files of the indexed chunks: file id -> {"name", "added_at", "chunks"}
+        self.files = {}
+        self._next_file_id = 0
+        
+        # Normalized embeddings live in a preallocated buffer that grows
+        # geometrically, so appending a batch never copies the whole corpus
+        self._embedding_buffer = None
+        self._metadata = None
+        self._size = 0
+        self.removed_count = 0
+        
+        # Search filter for removed rows still in an HNSW graph, with the selectors it points to
+        self._removed_selector = None
+        
+        # Per-batch ingest timings (most recent last)
+        self.ingest_timings = deque(maxlen=INGEST_TIMINGS_HISTORY)
+        
+        # Background ingest jobs add batches while the session searches
+        self._lock = threading.RLock()
+        
+        # Open handle on the memory-mapped index file, kept so a private copy can be
+        # read on the first write even after a newer save pruned the file
+        self._index_file = None
+        
+        # Set once this store is no longer the process-wide one; it may not overwrite the saved store
+        self.detached = False
+        
+        # Embeddings of previously seen chunks are reused instead of re-encoded
+        self.embedding_cache = None
+        if EMBEDDING_CACHE_ENABLED:
+            try:
+                self.embedding_cache = get_embedding_cache()
+            except Exception as e:
+                st.warning(f"Embedding cache unavailable: {e}")
+    
+    @property
+    def embeddings(self):
+        """Normalized embeddings of all indexed texts"""
+        if self._embedding_buffer is None:
+            return None
+        return self._embedding_buffer[:self._size]
+    
+    @property
+    def metadata(self) -> Dict[str, np.ndarray]:
+        """Metadata columns of all indexed texts, row i describing FAISS id i"""
+        if self._metadata is None:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in METADATA_COLUMNS.items()}
+        return {name: column[:self._size] for name, column in self._metadata.items()}
+    
+    @property
+    def live_count(self) -> int:
+        """Number of indexed texts, not counting removed ones"""
+        return self._size - self.removed_count
+    
+    def _live_rows(self) -> np.ndarray:
+        return np.flatnonzero(self.metadata["file_id"] != TOMBSTONE)
+    
+    def _add_to_index(self, index: faiss.Index, embeddings: np.ndarray, rows: np.ndarray):
+        """Add vectors under their buffer rows as ids"""
+        if isinstance(index, (faiss.IndexFlat, faiss.IndexHNSW)):
+            # Indexes saved before ids were kept are positional, which matches rows until a removal rebuilds them
+            index.add(embeddings)
+        else:
+            index.add_with_ids(embeddings, rows.astype('int64'))
+    
+    def _reserve(self, extra_rows: int):
+        """Make room for extra_rows more embeddings in the buffer"""
+        needed = self._size + extra_rows
+        if self._embedding_buffer is None:
+            capacity = max(needed, VECTOR_BUFFER_INITIAL_CAPACITY)
+            self._embedding_buffer = np.empty((capacity, self.dimension), dtype='float32')
+            self._metadata = {name: np.empty(capacity, dtype=dtype) for name, dtype in METADATA_COLUMNS.items()}
+            return
+        
+        capacity = self._embedding_buffer.shape[0]
+        if needed <= capacity:
+            return
+        
+        # Amortized O(1) growth per row
+        new_capacity = max(needed, capacity * 2)
+        self._embedding_buffer = _grown(self._embedding_buffer, new_capacity, self._size)
+        self._metadata = {name: _grown(column, new_capacity, self._size) for name, column in self._metadata.items()}
+    
+    @property
+    def read_only(self) -> bool:
+        """Whether the index or the embeddings are still memory-mapped from disk"""
+        return self._index_file is not None or isinstance(self._embedding_buffer, np.memmap)
+    
+    def _release_index_file(self):
+        if self._index_file is not None:
+            self._index_file.close()
+            self._index_file = None
     
-    def add_texts(self, texts: List[str]):
-        """Add texts to vector store"""
+    def _ensure_index_writable(self):
+        """Replace a memory-mapped index with a private copy before modifying it"""
+        if self._index_file is None:
+            return
+        # Memory-mapped IVF lists cannot be cloned, so every index type is read
+        # again, from the handle opened at load time rather than from its path
+        self._index_file.seek(0)
+        self.index = faiss.read_index(faiss.PyCallbackIOReader(self._index_file.read))
+        self._release_index_file()
+    
+    def _ensure_writable(self):
+        """Copy a memory-mapped index and embeddings into private memory before appending to them"""
+        self._ensure_index_writable()
+        if isinstance(self._embedding_buffer, np.memmap):
+            self._embedding_buffer = np.array(self._embedding_buffer[:self._size], dtype='float32')
+    
+    def _append_embeddings(self, embeddings: np.ndarray, metadata: Dict[str, np.ndarray]):
+        """Normalize new embeddings and append them, with their metadata columns, to the buffer and index"""
+        embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+        self._ensure_writable()
+        
+        if self.index is None:
+            self.dimension = embeddings.shape[1]
+            self.index = create_index("flat", self.dimension)
+            self.index_type = "flat"
+        
+        # Normalize only the new rows for cosine similarity
+        faiss.normalize_L2(embeddings)
+        
+        self._reserve(len(embeddings))
+        first_row = self._size
+        rows = slice(first_row, first_row + len(embeddings))
+        self._embedding_buffer[rows] = embeddings
+        for name, column in self._metadata.items():
+            column[rows] = metadata[name]
+        self._size += len(embeddings)
+        
+        if self._needs_rebuild():
+            # Rebuilt from the stored embeddings, nothing is re-encoded
+            self.rebuild_index(INDEX_TYPE)
+        else:
+            self._add_to_index(self.index, embeddings, np.arange(first_row, self._size))
+    
+    def _needs_rebuild(self) -> bool:
+        """Check whether the corpus has outgrown the current index"""
+        if INDEX_TYPE == "flat" or self.live_count < ANN_TRAIN_THRESHOLD:
+            return False
+        if self.index_type == "flat":
+            return True
+        return self.index_type in IVF_INDEX_TYPES and self.live_count >= self.trained_size * ANN_RETRAIN_FACTOR
+    
+    def _compact(self):
+        """Drop removed rows from the embeddings, metadata and texts, renumbering the rows after them"""
+        rows = self._live_rows()
+        self._embedding_buffer = np.array(self.embeddings[rows], dtype='float32')
+        self._metadata = {name: column[rows] for name, column in self.metadata.items()}
+        self.texts = self.texts.take(rows)
+        self._size = len(rows)
+        self.removed_count = 0
+    
+    def rebuild_index(self, index_type: str):
+        """Build a fresh index of index_type from the stored embeddings, compacting away removed rows first"""
+        if self._size == 0:
+            return
+        
+        if self.removed_count:
+            # The index is rebuilt anyway, so row ids are free to change
+            self._compact()
+        rows = np.arange(self._size)
+        embeddings = self.embeddings
+        if len(rows) == 0:
+            # Nothing left to train on
+            index_type = "flat"
+        index = create_index(index_type, self.dimension, len(rows))
+        
+        if not index.is_trained:
+            training_points = embeddings
+            if len(rows) > ANN_MAX_TRAINING_POINTS:
+                sample = np.random.default_rng(0).choice(len(rows), ANN_MAX_TRAINING_POINTS, replace=False)
+                training_points = training_points[np.sort(sample)]
+            index.train(training_points)
+        
+        self._add_to_index(index, embeddings, rows)
+        
+        self.index = index
+        self._release_index_file()
+        self.index_type = index_type
+        self.trained_size = len(rows)
+        self._removed_selector = None
+    
+    def _search_params(self, search_mode: str = None):
+        """Get nprobe/efSearch parameters for a search mode"""
+        params = SEARCH_MODE_PARAMS.get(search_mode, SEARCH_MODE_PARAMS[DEFAULT_SEARCH_MODE])
+        if self.index_type in IVF_INDEX_TYPES:
+            return faiss.SearchParametersIVF(nprobe=params["nprobe"])
+        if self.index_type == "hnsw":
+            selector = self._hnsw_removed_selector()
+            if selector is not None:
+                return faiss.SearchParametersHNSW(efSearch=params["ef_search"], sel=selector)
+            return faiss.SearchParametersHNSW(efSearch=params["ef_search"])
+        return None
+    
+    def _hnsw_removed_selector(self):
+        """Selector skipping removed rows that are still nodes of the HNSW graph, None if there are none"""
+        if self.index.ntotal <= self.live_count:
+            return None
+        if self._removed_selector is None:
+            removed = faiss.IDSelectorBatch(np.flatnonzero(self.metadata["file_id"] == TOMBSTONE).astype('int64'))
+            # IDSelectorNot only points at the batch selector, so both are kept alive together
+            self._removed_selector = (faiss.IDSelectorNot(removed), removed)
+        return self._removed_selector[0]
+    
+    def encode_texts(self, texts: List[str]) -> np.ndarray:
+        """Encode texts, consulting the embedding cache first"""
+        if self.embedding_cache is None:
+            return self.model.encode(texts, show_progress_bar=False)
+        
+        embeddings = self.embedding_cache.get_many(self.model_name, texts)
+        missing = [i for i, vector in enumerate(embeddings) if vector is None]
+        
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            new_embeddings = self.model.encode(missing_texts, show_progress_bar=False)
+            self.embedding_cache.put_many(self.model_name, missing_texts, new_embeddings)
+            for i, vector in zip(missing, new_embeddings):
+                embeddings[i] = vector
+        
+        return np.vstack(embeddings)
+    
+    def add_file(self, name: str) -> int:
+        """Register a source file and get the id to pass in its chunks' metadata"""
+        with self._lock:
+            file_id = self._next_file_id
+            self._next_file_id += 1
+            self.files[file_id] = {"name": name, "added_at": time.time(), "chunks": 0}
+            return file_id
+    
+    def get_document_rows(self, file_id: int) -> np.ndarray:
+        """FAISS ids of a file's chunks, found from the file id column without touching the texts"""
+        with self._lock:
+            return np.flatnonzero(self.metadata["file_id"] == file_id)
+    
+    def remove_document(self, file_id: int) -> int:
+        """Remove a file's chunks from the index, leaving every other vector untouched.
+        
+        Flat and IVF indexes drop the file's ids in place. HNSW graphs cannot
+        delete nodes, so removed rows are skipped at search time. The rows stay
+        in the buffer as tombstones so the ids of other chunks do not change,
+        until they exceed TOMBSTONE_COMPACT_RATIO of the store; then the store
+        is compacted and its index rebuilt from the stored embeddings. Nothing
+        is re-encoded either way. Returns the number of chunks removed.
+        """
+        with self._lock:
+            rows = self.get_document_rows(file_id)
+            self.files.pop(file_id, None)
+            if len(rows) == 0:
+                return 0
+            
+            self._metadata["file_id"][rows] = TOMBSTONE
+            for row in rows:
+                self.texts[row] = None
+            self.removed_count += len(rows)
+            
+            if isinstance(self.index, faiss.IndexFlat) or self.removed_count > self._size * TOMBSTONE_COMPACT_RATIO:
+                # Positional flat indexes saved before ids were kept would renumber on removal
+                self.rebuild_index(self.index_type)
+            elif self.index_type == "hnsw":
+                self._removed_selector = None
+            else:
+                self._ensure_index_writable()
+                self.index.remove_ids(rows.astype('int64'))
+            return len(rows)
+    
+    def replace_document(self, file_id: int, texts: List[str], embeddings=None, metadata: List[Dict] = None,
+                         name: str = None):
+        """Swap a file's chunks for new ones under the same file id; searches never see it half replaced"""
+        if embeddings is None and texts:
+            embeddings = self.encode_texts(texts)
+        metadata = [dict(location, file_id=file_id) for location in (metadata or [{} for _ in texts])]
+        
+        with self._lock:
+            file_info = self.files.get(file_id, {})
+            self.remove_document(file_id)
+            self.files[file_id] = {"name": name or file_info.get("name"), "added_at": time.time(), "chunks": 0}
+            self._next_file_id = max(self._next_file_id, file_id + 1)
+            if texts:
+                self.add_texts(texts, embeddings=[embeddings], show_progress=False, metadata=metadata)
+    
+    def get_metadata(self, row: int) -> Dict:
+        """Source attribution of one indexed chunk"""
+        metadata = {}
+        for name in METADATA_COLUMNS:
+            value = self._metadata[name][row].item()
+            metadata[name] = value if value >= 0 else None
+        file_info = self.files.get(metadata["file_id"])
+        metadata["file_name"] = file_info["name"] if file_info else None
+        return metadata
+    
+    def add_texts(self, texts: List[str], embeddings=None, show_progress: bool = True, metadata: List[Dict] = None):
+        """Add texts to vector store, optionally with precomputed (unnormalized) embeddings.
+        
+        metadata, if given, holds one dict per text with its "file_id" (from
+        add_file), "page" and "char_offset"; missing values are stored as unknown.
+        Without show_progress, as in background ingestion, errors are raised to
+        the caller instead of shown.
+        """
         if not texts:
             return
         
         # Filter out empty texts
-        valid_texts = [text for text in texts if text.strip()]
+        valid_rows = [i for i, text in enumerate(texts) if text.strip()]
+        valid_texts = [texts[i] for i in valid_rows]
         if not valid_texts:
             return
         
-        self.texts.extend(valid_texts)
-        
         # Generate embeddings with progress bar
-        progress_bar = st.progress(0)
-        st.info(f"Generating embeddings for {len(valid_texts)} text chunks...")
+        progress_bar = st.progress(0) if show_progress else None
+        if embeddings is None and show_progress:
+            st.info(f"Generating embeddings for {len(valid_texts)} text chunks...")
         
         try:
-            new_embeddings = self.model.encode(valid_texts, show_progress_bar=False)
-            progress_bar.progress(0.5)
-            
-            if self.embeddings is None:
-                self.embeddings = new_embeddings
-                self.dimension = new_embeddings.shape[1]
+            start = time.perf_counter()
+            if embeddings is None:
+                new_embeddings = self.encode_texts(valid_texts)
             else:
-                self.embeddings = np.vstack([self.embeddings, new_embeddings])
-            
-            # Create/update FAISS index
-            if self.index is None:
-                self.index = faiss.IndexFlatIP(self.dimension)  # Inner product similarity
+                new_embeddings = np.vstack(embeddings)[valid_rows]
+            encoded = time.perf_counter()
+            if progress_bar:
+                progress_bar.progress(0.5)
             
-            # Normalize embeddings for cosine similarity
-            embeddings_normalized = self.embeddings.copy()
-            faiss.normalize_L2(embeddings_normalized)
+            columns = {name: np.full(len(valid_rows), -1, dtype=dtype) for name, dtype in METADATA_COLUMNS.items()}
+            columns["ingested_at"][:] = time.time()
+            if metadata is not None:
+                for column_row, row in enumerate(valid_rows):
+                    for name in ("file_id", "page", "char_offset"):
+                        value = metadata[row].get(name)
+                        if value is not None:
+                            columns[name][column_row] = value
             
-            # Clear and rebuild index
-            self.index.reset()
-            self.index.add(embeddings_normalized.astype('float32'))
+            # Append only the new batch; existing vectors are left untouched
+            with self._lock:
+                self._append_embeddings(new_embeddings, columns)
+                self.texts.extend(valid_texts)
+                for file_id, count in zip(*np.unique(columns["file_id"], return_counts=True)):
+                    if file_id in self.files:
+                        self.files[file_id]["chunks"] += int(count)
+            indexed = time.perf_counter()
             
-            progress_bar.progress(1.0)
-            progress_bar.empty()
+            self.ingest_timings.append({
+                "chunks": len(valid_texts),
+                "encode_seconds": encoded - start,
+                "index_seconds": indexed - encoded,
+                "total_seconds": indexed - start,
+                "total_texts": self.live_count
+            })
             
+            if progress_bar:
+                progress_bar.progress(1.0)
+                progress_bar.empty()
+        
         except Exception as e:
+            if not show_progress:
+                raise
             st.error(f"Error generating embeddings: {e}")
-            progress_bar.empty()
+            if progress_bar:
+                progress_bar.empty()
     
-    def search(self, query: str, k: int = 5) -> List[Tuple[str, float]]:
+    def search(self, query: str, k: int = 5, search_mode: str = None, with_metadata: bool = False) -> List[Tuple]:
         """Search for similar texts"""
-        if self.index is None or len(self.texts) == 0:
-            return []
+        return self.search_batch([query], k, search_mode, with_metadata)[0]
+    
+    def search_batch(self, queries: List[str], k: int = 5, search_mode: str = None,
+                     with_metadata: bool = False) -> List[List[Tuple]]:
+        """Search for several queries with one encode call and one index search.
+        
+        Results are (text, score) pairs, or (text, score, metadata) with
+        with_metadata, where metadata is the chunk's get_metadata() dict.
+        """
+        if self.index is None or self.live_count == 0 or not queries:
+            return [[] for _ in queries]
         
         try:
-            # Encode query
-            query_embedding = self.model.encode([query])
-            faiss.normalize_L2(query_embedding)
+            # Encode all queries together
+            query_embeddings = np.ascontiguousarray(self.model.encode(queries, show_progress_bar=False), dtype='float32')
+            faiss.normalize_L2(query_embeddings)
             
             # Search
-            scores, indices = self.index.search(query_embedding.astype('float32'), min(k, len(self.texts)))
+            with self._lock:
+                scores, indices = self.index.search(
+                    query_embeddings, min(k, self.live_count),
+                    params=self._search_params(search_mode)
+                )
+                
+                all_results = []
+                for query_scores, query_indices in zip(scores, indices):
+                    results = []
+                    for score, idx in zip(query_scores, query_indices):
+                        # ANN indexes pad with -1 when fewer than k neighbours are found
+                        if 0 <= idx < len(self.texts) and self.texts[idx] is not None and score > SIMILARITY_THRESHOLD:
+                            if with_metadata:
+                                results.append((self.texts[idx], float(score), self.get_metadata(idx)))
+                            else:
+                                results.append((self.texts[idx], float(score)))
+                    all_results.append(results)
             
-            results = []
-            for score, idx in zip(scores[0], indices[0]):
-                if idx < len(self.texts) and score > SIMILARITY_THRESHOLD:
-                    results.append((self.texts[idx], float(score)))
-            
-            return results
+            return all_results
         except Exception as e:
             st.error(f"Search error: {e}")
+            return [[] for _ in queries]
+    
+    def benchmark(self, queries: List[str] = None, k: int = 10, sample_size: int = 200) -> List[dict]:
+        """Report recall@k and latency of each search mode against exact search"""
+        if self.live_count == 0:
             return []
+        
+        rows = self._live_rows()
+        if queries:
+            query_embeddings = np.ascontiguousarray(self.model.encode(queries), dtype='float32')
+            faiss.normalize_L2(query_embeddings)
+        else:
+            # Use stored chunks as queries when none are given
+            sample = np.random.default_rng(0).choice(rows, min(sample_size, len(rows)), replace=False)
+            query_embeddings = np.ascontiguousarray(self.embeddings[np.sort(sample)])
+        
+        k = min(k, len(rows))
+        exact_index = create_index("flat", self.dimension)
+        exact_index.add_with_ids(np.ascontiguousarray(self.embeddings[rows]), rows.astype('int64'))
+        
+        start = time.perf_counter()
+        _, exact_ids = exact_index.search(query_embeddings, k)
+        exact_seconds = time.perf_counter() - start
+        
+        report = [{
+            "search_mode": "exact",
+            "index_type": "flat",
+            "recall": 1.0,
+            "latency_ms": exact_seconds * 1000 / len(query_embeddings)
+        }]
+        
+        for search_mode in SEARCH_MODE_PARAMS:
+            start = time.perf_counter()
+            _, ids = self.index.search(query_embeddings, k, params=self._search_params(search_mode))
+            seconds = time.perf_counter() - start
+            
+            hits = sum(len(set(found) & set(expected)) for found, expected in zip(ids, exact_ids))
+            report.append({
+                "search_mode": search_mode,
+                "index_type": self.index_type,
+                "recall": hits / exact_ids.size,
+                "latency_ms": seconds * 1000 / len(query_embeddings)
+            })
+        
+        return report
+    
+    def save(self, directory: str):
+        """Write index, embeddings, texts and chunk metadata as a new generation of the store in directory.
+        
+        The generation is written completely under a temporary name, renamed into
+        place and only then published by atomically replacing the CURRENT pointer,
+        so loaders always get one consistent generation and concurrent writers
+        never share a file. The newest VECTOR_STORE_GENERATIONS_KEPT generations
+        are kept for loaders that read the previous pointer.
+        """
+        if self.index is None:
+            return
+        
+        with self._lock:
+            if self.detached:
+                return
+            os.makedirs(directory, exist_ok=True)
+            generation = f"{GENERATION_PREFIX}{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+            path = os.path.join(directory, generation)
+            tmp_path = path + ".tmp"
+            os.makedirs(tmp_path)
+            
+            faiss.write_index(self.index, os.path.join(tmp_path, INDEX_FILE))
+            with open(os.path.join(tmp_path, EMBEDDINGS_FILE), "wb") as f:
+                np.save(f, self.embeddings)
+            with open(os.path.join(tmp_path, METADATA_FILE), "wb") as f:
+                np.savez(f, **self.metadata)
+            self.texts.save(os.path.join(tmp_path, TEXTS_FILE), os.path.join(tmp_path, TEXT_OFFSETS_FILE))
+            with open(os.path.join(tmp_path, STORE_FILE), "wb") as f:
+                pickle.dump({
+                    "files": self.files,
+                    "next_file_id": self._next_file_id,
+                    "dimension": self.dimension,
+                    "index_type": self.index_type,
+                    "trained_size": self.trained_size,
+                    "model_name": self.model_name
+                }, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_path, path)
+            
+            current_path = os.path.join(directory, CURRENT_FILE)
+            current_tmp_path = f"{current_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(current_tmp_path, "w", encoding="utf-8") as f:
+                f.write(generation)
+            os.replace(current_tmp_path, current_path)
+        
+        self._prune_generations(directory)
+    
+    @staticmethod
+    def _current_path(directory: str) -> str:
+        """Directory holding the files of the published generation"""
+        try:
+            with open(os.path.join(directory, CURRENT_FILE), encoding="utf-8") as f:
+                return os.path.join(directory, f.read().strip())
+        except OSError:
+            # Stores saved before generations were kept their files directly in directory
+            return directory
+    
+    @classmethod
+    def _prune_generations(cls, directory: str):
+        """Delete generations older than the newest VECTOR_STORE_GENERATIONS_KEPT, never the published one"""
+        current = os.path.basename(cls._current_path(directory))
+        generations = sorted(
+            name for name in os.listdir(directory)
+            if name.startswith(GENERATION_PREFIX) and not name.endswith(".tmp")
+        )
+        for name in generations[:-VECTOR_STORE_GENERATIONS_KEPT]:
+            if name != current:
+                # Sessions that memory-mapped these files keep their pages until they close them
+                shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    
+    @staticmethod
+    def delete_saved(directory: str):
+        """Delete every saved generation in directory, and the files of the old flat layout"""
+        # Unpublish first so loaders see no store rather than a half-deleted one
+        for name in (CURRENT_FILE, INDEX_FILE, EMBEDDINGS_FILE, STORE_FILE, METADATA_FILE, TEXTS_FILE, TEXT_OFFSETS_FILE):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                if name.startswith(GENERATION_PREFIX):
+                    shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    
+    @classmethod
+    def exists(cls, directory: str) -> bool:
+        """Check whether a saved vector store is present in a directory"""
+        path = cls._current_path(directory)
+        return all(
+            os.path.exists(os.path.join(path, name))
+            for name in (INDEX_FILE, EMBEDDINGS_FILE, STORE_FILE)
+        )
+    
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "VectorStore":
+        """Load the published generation of a saved vector store, memory-mapping the index, embeddings and texts"""
+        path = cls._current_path(directory)
+        with open(os.path.join(path, STORE_FILE), "rb") as f:
+            state = pickle.load(f)
+        
+        store = cls(state["model_name"])
+        if "texts" in state:
+            # Stores saved before the texts had their own files
+            store.texts = TextColumn(state["texts"])
+        elif mmap:
+            store.texts = TextColumn.load(os.path.join(path, TEXTS_FILE), os.path.join(path, TEXT_OFFSETS_FILE))
+        else:
+            store.texts = TextColumn(blob=np.load(os.path.join(path, TEXTS_FILE)), offsets=np.load(os.path.join(path, TEXT_OFFSETS_FILE)))
+        store.files = state.get("files", {})
+        store._next_file_id = state.get("next_file_id", 0)
+        store.dimension = state["dimension"]
+        store.index_type = state.get("index_type", "flat")
+        store.trained_size = state.get("trained_size", 0)
+        
+        index_path = os.path.join(path, INDEX_FILE)
+        embeddings_path = os.path.join(path, EMBEDDINGS_FILE)
+        
+        if mmap:
+            # Pages are shared through the OS page cache across sessions and processes
+            store._index_file = open(index_path, "rb")
+            store.index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            store._embedding_buffer = np.load(embeddings_path, mmap_mode='r')
+        else:
+            store.index = faiss.read_index(index_path)
+            store._embedding_buffer = np.load(embeddings_path)
+        
+        store._size = len(store._embedding_buffer)
+        
+        # Metadata is small, so it is read into memory; stores saved before it existed get unknowns
+        metadata_path = os.path.join(path, METADATA_FILE)
+        if os.path.exists(metadata_path):
+            with np.load(metadata_path) as columns:
+                store._metadata = {name: np.array(columns[name], dtype=dtype) for name, dtype in METADATA_COLUMNS.items()}
+        else:
+            store._metadata = {name: np.full(store._size, -1, dtype=dtype) for name, dtype in METADATA_COLUMNS.items()}
+        store.removed_count = int(np.count_nonzero(store._metadata["file_id"] == TOMBSTONE))
+        return store
+    
+    @classmethod
+    def load_or_create(cls, directory: str) -> "VectorStore":
+        """Open the saved vector store in a directory, or start an empty one"""
+        if cls.exists(directory):
+            try:
+                return cls.load(directory)
+            except Exception as e:
+                st.warning(f"Could not load saved knowledge base: {e}")
+        return cls()
     
     def get_stats(self) -> dict:
         """Get statistics about the vector store"""
         return {
-            "total_texts": len(self.texts),
+            "total_texts": self.live_count,
+            "removed_texts": self.removed_count,
+            "total_files": len(self.files),
             "has_index": self.index is not None,
             "dimension": self.dimension,
-            "model_name": self.model._modules['0'].auto_model.name_or_path if hasattr(self.model, '_modules') else "unknown"
+            "index_type": self.index_type,
+            "model_name": self.model_name,
+            "buffer_capacity": self._embedding_buffer.shape[0] if self._embedding_buffer is not None else 0,
+            "last_ingest": self.ingest_timings[-1] if self.ingest_timings else None,
+            "read_only": self.read_only,
+            "embedding_cache": self.embedding_cache.get_stats() if self.embedding_cache else None
         }
+
+_shared_store = None
+_shared_store_lock = threading.Lock()
+
+def get_vector_store(directory: str = VECTOR_STORE_DIR) -> VectorStore:
+    """Get the process-wide knowledge base, loaded from directory once and shared by every session"""
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is None:
+            _shared_store = VectorStore.load_or_create(directory)
+        return _shared_store
+
+def reset_vector_store(directory: str = VECTOR_STORE_DIR) -> VectorStore:
+    """Replace the process-wide knowledge base with an empty one and delete it from disk"""
+    global _shared_store
+    with _shared_store_lock:
+        next_file_id = 0
+        if _shared_store is not None:
+            # Waits for a save in progress; jobs still holding the old store can no longer write it back
+            with _shared_store._lock:
+                _shared_store.detached = True
+                next_file_id = _shared_store._next_file_id
+        VectorStore.delete_saved(directory)
+        
+        _shared_store = VectorStore()
+        # File ids are not reused, so results of jobs on the old store never match a new file
+        _shared_store._next_file_id = next_file_id
+        return _shared_store
@@ -1,69 +1,132 @@
-
 import requests
 from bs4 import BeautifulSoup
 from typing import List, Dict
 import streamlit as st
+import asyncio
+import threading
+import weakref
+import httpx
 import time
 import json
+import re
+from ttl_cache import TTLCache
+from config import (
+    WEB_REQUEST_TIMEOUT, WEB_MAX_CONNECTIONS, WEB_MAX_KEEPALIVE,
+    WEB_CACHE_MAX_ENTRIES, WEB_CACHE_TTL, WEB_CACHE_PATH
+)
+
+INSTANT_ANSWER_URL = "https://api.duckduckgo.com/"
+HTML_SEARCH_URL = "https://html.duckduckgo.com/html/"
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+# Results shared by every session in this process
+_search_cache = TTLCache(WEB_CACHE_MAX_ENTRIES, WEB_CACHE_TTL, persist_path=WEB_CACHE_PATH)
+
+def _cache_key(query: str, max_results: int) -> tuple:
+    """Normalize case, whitespace and surrounding punctuation so near-identical queries share an entry"""
+    normalized = re.sub(r'\s+', ' ', query.lower()).strip(' ?!.,;:\'"')
+    return normalized, max_results
+
+def get_search_cache_stats() -> dict:
+    """Get hit/miss metrics of the web search result cache"""
+    return _search_cache.get_stats()
+
+def _instant_answer_params(query: str) -> Dict:
+    return {
+        'q': query,
+        'format': 'json',
+        'no_html': '1',
+        'skip_disambig': '1'
+    }
+
+def _parse_instant_answer(data: Dict, max_results: int) -> List[Dict]:
+    """Turn a DuckDuckGo instant answer response into result dicts"""
+    results = []
+    
+    # Abstract (direct answer)
+    if data.get('Abstract'):
+        results.append({
+            'title': 'Direct Answer',
+            'snippet': data['Abstract'],
+            'url': data.get('AbstractURL', ''),
+            'source': 'DuckDuckGo'
+        })
+    
+    # Answer from Infobox
+    if data.get('Answer'):
+        results.append({
+            'title': 'Quick Answer',
+            'snippet': data['Answer'],
+            'url': data.get('AnswerURL', ''),
+            'source': 'DuckDuckGo'
+        })
+    
+    # Related topics
+    for topic in data.get('RelatedTopics', [])[:max_results-len(results)]:
+        if isinstance(topic, dict) and 'Text' in topic:
+            results.append({
+                'title': topic.get('FirstURL', '').split('/')[-1].replace('_', ' ').title(),
+                'snippet': topic['Text'],
+                'url': topic.get('FirstURL', ''),
+                'source': 'Wikipedia'
+            })
+    
+    return results
+
+def _parse_html_results(content: bytes, max_results: int) -> List[Dict]:
+    """Turn a DuckDuckGo HTML results page into result dicts"""
+    soup = BeautifulSoup(content, 'html.parser')
+    
+    results = []
+    search_results = soup.find_all('div', class_='result')[:max_results]
+    
+    for result in search_results:
+        title_elem = result.find('a', class_='result__a')
+        snippet_elem = result.find('a', class_='result__snippet')
+        
+        if title_elem and snippet_elem:
+            results.append({
+                'title': title_elem.get_text().strip(),
+                'snippet': snippet_elem.get_text().strip(),
+                'url': title_elem.get('href', ''),
+                'source': 'Web Search'
+            })
+    
+    return results
+
+def _dedupe_results(results: List[Dict], max_results: int) -> List[Dict]:
+    """Remove duplicates based on title similarity"""
+    unique_results = []
+    seen_titles = set()
+    
+    for result in results:
+        title_lower = result['title'].lower()
+        if title_lower not in seen_titles:
+            seen_titles.add(title_lower)
+            unique_results.append(result)
+    
+    return unique_results[:max_results]
 
 class WebSearcher:
     def __init__(self):
         self.session = requests.Session()
         self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+            'User-Agent': USER_AGENT
         })
     
     def search_duckduckgo(self, query: str, max_results: int = 5) -> List[Dict]:
         """Search using DuckDuckGo (free alternative)"""
         try:
             # DuckDuckGo instant answer API
-            url = "https://api.duckduckgo.com/"
-            params = {
-                'q': query,
-                'format': 'json',
-                'no_html': '1',
-                'skip_disambig': '1'
-            }
-            
-            response = self.session.get(url, params=params, timeout=10)
-            data = response.json()
-            
-            results = []
-            
-            # Abstract (direct answer)
-            if data.get('Abstract'):
-                results.append({
-                    'title': 'Direct Answer',
-                    'snippet': data['Abstract'],
-                    'url': data.get('AbstractURL', ''),
-                    'source': 'DuckDuckGo'
-                })
-            
-            # Answer from Infobox
-            if data.get('Answer'):
-                results.append({
-                    'title': 'Quick Answer',
-                    'snippet': data['Answer'],
-                    'url': data.get('AnswerURL', ''),
-                    'source': 'DuckDuckGo'
-                })
-            
-            # Related topics
-            for topic in data.get('RelatedTopics', [])[:max_results-len(results)]:
-                if isinstance(topic, dict) and 'Text' in topic:
-                    results.append({
-                        'title': topic.get('FirstURL', '').split('/')[-1].replace('_', ' ').title(),
-                        'snippet': topic['Text'],
-                        'url': topic.get('FirstURL', ''),
-                        'source': 'Wikipedia'
-                    })
+            response = self.session.get(INSTANT_ANSWER_URL, params=_instant_answer_params(query), timeout=WEB_REQUEST_TIMEOUT)
+            results = _parse_instant_answer(response.json(), max_results)
             
             # If no results, try web scraping as fallback
             if not results:
                 results = self.search_web_scraping(query, max_results)
             
             return results
-            
+        
         except Exception as e:
             st.warning(f"DuckDuckGo search error: {str(e)}. Trying alternative method...")
             return self.search_web_scraping(query, max_results)
@@ -72,48 +135,114 @@ class WebSearcher:
         """Backup search using web scraping"""
         try:
             # Search using a different approach
-            search_url = f"https://html.duckduckgo.com/html/?q={query.replace(' ', '+')}"
-            
-            response = self.session.get(search_url, timeout=10)
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            results = []
-            search_results = soup.find_all('div', class_='result')[:max_results]
-            
-            for result in search_results:
-                title_elem = result.find('a', class_='result__a')
-                snippet_elem = result.find('a', class_='result__snippet')
-                
-                if title_elem and snippet_elem:
-                    results.append({
-                        'title': title_elem.get_text().strip(),
-                        'snippet': snippet_elem.get_text().strip(),
-                        'url': title_elem.get('href', ''),
-                        'source': 'Web Search'
-                    })
-            
-            return results
+            search_url = f"{HTML_SEARCH_URL}?q={query.replace(' ', '+')}"
             
+            response = self.session.get(search_url, timeout=WEB_REQUEST_TIMEOUT)
+            return _parse_html_results(response.content, max_results)
+        
         except Exception as e:
             st.error(f"Web scraping error: {str(e)}")
             return []
     
     def search_multiple_sources(self, query: str, max_results: int = 5) -> List[Dict]:
         """Search multiple sources and combine results"""
+        key = _cache_key(query, max_results)
+        cached = _search_cache.get(key)
+        if cached is not None:
+            return list(cached)
+        
         all_results = []
         
         # Try DuckDuckGo first
         ddg_results = self.search_duckduckgo(query, max_results)
         all_results.extend(ddg_results)
         
-        # Remove duplicates based on title similarity
-        unique_results = []
-        seen_titles = set()
+        results = _dedupe_results(all_results, max_results)
+        if results:
+            _search_cache.set(key, results)
+        return results
+
+# One pooled keep-alive client per event loop, shared by every AsyncWebSearcher
+_clients = weakref.WeakKeyDictionary()
+
+# Event loop thread that serves the synchronous entry points
+_loop = None
+_loop_lock = threading.Lock()
+
+def _get_background_loop() -> asyncio.AbstractEventLoop:
+    """Get the process-wide event loop used by synchronous callers"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="web-search-loop", daemon=True).start()
+        return _loop
+
+class AsyncWebSearcher:
+    """WebSearcher variant that races the instant-answer API and the HTML endpoint"""
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = _clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                headers={'User-Agent': USER_AGENT},
+                timeout=WEB_REQUEST_TIMEOUT,
+                limits=httpx.Limits(max_connections=WEB_MAX_CONNECTIONS, max_keepalive_connections=WEB_MAX_KEEPALIVE),
+                follow_redirects=True
+            )
+            _clients[loop] = client
+        return client
+    
+    async def asearch_duckduckgo(self, query: str, max_results: int = 5) -> List[Dict]:
+        """Query the DuckDuckGo instant answer API"""
+        response = await self._get_client().get(INSTANT_ANSWER_URL, params=_instant_answer_params(query))
+        return _parse_instant_answer(response.json(), max_results)
+    
+    async def asearch_web_scraping(self, query: str, max_results: int = 3) -> List[Dict]:
+        """Query the DuckDuckGo HTML endpoint"""
+        response = await self._get_client().get(HTML_SEARCH_URL, params={'q': query})
+        return _parse_html_results(response.content, max_results)
+    
+    async def asearch_multiple_sources(self, query: str, max_results: int = 5) -> List[Dict]:
+        """Race both endpoints; the first non-empty answer wins and the other is cancelled"""
+        key = _cache_key(query, max_results)
+        cached = _search_cache.get(key)
+        if cached is not None:
+            return list(cached)
+        
+        pending = {
+            asyncio.ensure_future(self.asearch_duckduckgo(query, max_results)),
+            asyncio.ensure_future(self.asearch_web_scraping(query, max_results))
+        }
+        errors = []
         
-        for result in all_results:
-            title_lower = result['title'].lower()
-            if title_lower not in seen_titles:
-                seen_titles.add(title_lower)
-                unique_results.append(result)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        errors.append(task.exception())
+                    elif task.result():
+                        results = _dedupe_results(task.result(), max_results)
+                        _search_cache.set(key, results)
+                        return results
+        finally:
+            for task in pending:
+                task.cancel()
         
-        return unique_results[:max_results]
+        # Only surface an error when both endpoints failed
+        if len(errors) == 2:
+            raise errors[0]
+        return []
+    
+    def search_multiple_sources(self, query: str, max_results: int = 5) -> List[Dict]:
+        """Synchronous entry point for the Streamlit script"""
+        future = asyncio.run_coroutine_threadsafe(
+            self.asearch_multiple_sources(query, max_results), _get_background_loop()
+        )
+        try:
+            return future.result()
+        except Exception as e:
+            st.error(f"Web search error: {str(e)}")
+            return []